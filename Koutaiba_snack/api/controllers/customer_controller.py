@@ -1,22 +1,82 @@
 
-from fastapi import APIRouter
-from fastapi.encoders import jsonable_encoder
-from api.services import customer_service
-from api.utils.responses import json_response
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, Query
+from api.services import customer_service, order_timeseries
+from api.utils.responses import json_response, error_response, streamed_json_response
+from typing import Optional
 
 router = APIRouter()
 
 @router.get("/customers", summary="List customers from past orders")
-async def get_customers():
-    customers = await customer_service.get_all_customers()
-    return json_response(data=jsonable_encoder(customers), message="Customers retrieved successfully")
+async def get_customers(
+    limit: int = Query(50, gt=0, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+):
+    try:
+        customers, next_cursor = await customer_service.get_all_customers(limit, cursor)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    return json_response(
+        data=customers,
+        message="Customers retrieved successfully",
+        meta={"limit": limit, "next_cursor": next_cursor},
+    )
 
 @router.get("/analytics/popular-items", summary="Most ordered items")
-async def get_popular_items():
-    items = await customer_service.get_popular_items()
-    return json_response(data=jsonable_encoder(items), message="Popular items retrieved successfully")
+async def get_popular_items(
+    k: int = Query(10, gt=0, le=100, description="Number of items to return"),
+    days: Optional[int] = Query(None, gt=0, description="Only count the last N days (UTC), all-time if omitted"),
+    category: Optional[str] = Query(None, description="Only rank items of this category"),
+):
+    items = await customer_service.get_popular_items(k, days, category)
+    return json_response(data=items, message="Popular items retrieved successfully")
 
 @router.get("/analytics/revenue", summary="Revenue statistics")
-async def get_revenue_stats():
+async def get_revenue_stats(
+    start: Optional[datetime] = Query(None, description="Start of a custom window (inclusive)"),
+    end: Optional[datetime] = Query(None, description="End of a custom window (exclusive), defaults to now"),
+):
+    if end and not start:
+        return error_response(message="end requires start", status_code=400)
+    if start:
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        if end and end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        if end and end <= start:
+            return error_response(message="end must be after start", status_code=400)
+        window = await customer_service.get_revenue_for_window(start, end)
+        return json_response(data=window, message="Revenue for window retrieved successfully")
     stats = await customer_service.get_revenue_stats()
-    return json_response(data=jsonable_encoder(stats), message="Revenue statistics retrieved successfully")
+    return json_response(data=stats, message="Revenue statistics retrieved successfully")
+
+@router.get("/analytics/timeseries", summary="Revenue and order volume per hour or day")
+async def get_timeseries(
+    interval: str = Query("day", description="Bucket size: hour or day"),
+    start: Optional[datetime] = Query(None, description="Start of the range (inclusive), defaults to 30 days before end"),
+    end: Optional[datetime] = Query(None, description="End of the range (exclusive), defaults to now"),
+    tz: str = Query("UTC", description="Time zone the buckets follow, e.g. Europe/Paris"),
+):
+    """
+    Revenue, order count and average ticket of every hour or day in the
+    range, empty ones included, with the range totals in `meta`. Times
+    without an offset are taken in `tz`. Reflects orders up to
+    ANALYTICS_SNAPSHOT_TTL seconds old (`meta.as_of`).
+    """
+    try:
+        zone = order_timeseries.parse_timezone(tz)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    end = end or datetime.now(timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=zone)
+    start = start or end - timedelta(days=30)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=zone)
+    if end <= start:
+        return error_response(message="end must be after start", status_code=400)
+    try:
+        buckets, meta = await order_timeseries.get_timeseries(start, end, interval, zone)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    return streamed_json_response(buckets, message="Time series retrieved successfully", meta=meta)
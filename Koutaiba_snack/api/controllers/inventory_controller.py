@@ -1,44 +1,145 @@
 
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.encoders import jsonable_encoder
-from api.services import inventory_service
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from api.services import inventory_service, stock_alerts, stock_reservation
+from api.utils.events import format_event, stream_events
+from api.utils.pagination import page_meta
 from api.utils.responses import json_response, error_response
 from api.models import schemas
+from typing import List, Literal, Optional
 
 router = APIRouter()
 
+class StockAdjustment(BaseModel):
+    ingredient_id: int
+    quantity: float
+    mode: Literal["set", "add"] = "add"
+
+class StockAdjustmentBatch(BaseModel):
+    adjustments: List[StockAdjustment] = Field(..., min_length=1, max_length=5000)
+    atomic: bool = True
+
+class CartLine(BaseModel):
+    item_id: int
+    quantity: int = Field(1, gt=0)
+
+class CartCheck(BaseModel):
+    items: List[CartLine] = Field(..., min_length=1, max_length=500)
+
 @router.get("/ingredients", summary="List all ingredients with stock")
-async def get_ingredients():
-    ingredients = await inventory_service.get_all_ingredients()
-    return json_response(data=jsonable_encoder(ingredients), message="Ingredients retrieved successfully")
+async def get_ingredients(
+    limit: Optional[int] = Query(None, gt=0, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,name,current_stock"),
+    include: Optional[str] = Query(None, description="Related records to embed: items (the menu items using it)"),
+):
+    try:
+        selection = inventory_service.INGREDIENT_FIELDS.select(fields, include)
+        ingredients, next_cursor = await inventory_service.get_all_ingredients(limit, cursor, selection)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    return json_response(data=ingredients, message="Ingredients retrieved successfully", meta=page_meta(limit, cursor, next_cursor))
+
+@router.get("/ingredients/low-stock", summary="Show low-stock ingredients")
+async def get_low_stock_ingredients(
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,name,current_stock"),
+    include: Optional[str] = Query(None, description="Related records to embed: items (the menu items using it)"),
+):
+    try:
+        selection = inventory_service.INGREDIENT_FIELDS.select(fields, include)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    ingredients = await inventory_service.get_low_stock_ingredients(selection)
+    return json_response(data=ingredients, message="Low-stock ingredients retrieved successfully")
+
+@router.post("/ingredients/stock/bulk", summary="Apply many stock changes at once")
+async def bulk_adjust_stock(batch: StockAdjustmentBatch):
+    """
+    Sets ("set") or adds to ("add") the stock of many ingredients in one
+    request, e.g. for a supplier delivery or a stock count. With `atomic`
+    (the default) either every change is applied or none is.
+    """
+    applied, results = await inventory_service.bulk_adjust_stock(
+        [(adjustment.ingredient_id, adjustment.mode, adjustment.quantity) for adjustment in batch.adjustments],
+        batch.atomic,
+    )
+    failed = sum(1 for result in results if result['status'] not in ("updated", "not_applied"))
+    if failed and not applied:
+        return error_response(message=f"No stock changes applied: {failed} adjustment(s) failed", status_code=400, data=results)
+    message = "Stock levels updated successfully" if not failed else f"Stock levels updated, {failed} adjustment(s) failed"
+    return json_response(data=results, message=message)
+
+@router.get("/ingredients/low-stock/stream", summary="Stream low-stock alerts (Server-Sent Events)")
+async def stream_low_stock_alerts(request: Request):
+    """
+    Sends a `snapshot` event with the ingredients currently low on stock,
+    then a `low_stock` event whenever an ingredient falls to its minimum
+    level and a `restocked` event when it climbs back above it.
+    """
+    async def events():
+        # Subscribe before reading the snapshot, so no alert falls in between.
+        with stock_alerts.hub.subscribe() as queue:
+            snapshot = await inventory_service.get_low_stock_ingredients()
+            async for chunk in stream_events(queue, [format_event("snapshot", snapshot)], request.is_disconnected):
+                yield chunk
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @router.get("/ingredients/{ingredient_id}", summary="Get specific ingredient details")
-async def get_ingredient(ingredient_id: int):
-    ingredient = await inventory_service.get_ingredient_by_id(ingredient_id)
+async def get_ingredient(
+    ingredient_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,name,current_stock"),
+    include: Optional[str] = Query(None, description="Related records to embed: items (the menu items using it)"),
+):
+    try:
+        selection = inventory_service.INGREDIENT_FIELDS.select(fields, include)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    ingredient = await inventory_service.get_ingredient_by_id(ingredient_id, selection)
     if not ingredient:
         return error_response(message=f"Ingredient with ID {ingredient_id} not found", status_code=404)
-    return json_response(data=jsonable_encoder(ingredient), message="Ingredient details retrieved successfully")
+    return json_response(data=ingredient, message="Ingredient details retrieved successfully")
 
 @router.get("/ingredients/items/{item_id}", summary="Get ingredients for a menu item")
 async def get_ingredients_for_item(item_id: int):
     ingredients = await inventory_service.get_ingredients_for_item(item_id)
     if not ingredients:
         return error_response(message=f"No ingredients found for item with ID {item_id}", status_code=404)
-    return json_response(data=jsonable_encoder(ingredients), message="Ingredients for item retrieved successfully")
-
-@router.get("/ingredients/low-stock", summary="Show low-stock ingredients")
-async def get_low_stock_ingredients():
-    ingredients = await inventory_service.get_low_stock_ingredients()
-    return json_response(data=jsonable_encoder(ingredients), message="Low-stock ingredients retrieved successfully")
+    return json_response(data=ingredients, message="Ingredients for item retrieved successfully")
 
 @router.get("/stock/check-item/{item_id}", summary="Check if item can be made")
 async def check_item_availability(item_id: int, quantity: int = Query(1, gt=0)):
     can_be_made = await inventory_service.check_item_availability(item_id, quantity)
     return json_response(data={"can_be_made": can_be_made}, message=f"Stock availability check for item {item_id}")
 
+@router.post("/stock/check-cart", summary="Check if a whole cart can be made")
+async def check_cart_availability(cart: CartCheck):
+    """
+    Checks the combined ingredient demand of every line in the cart, so
+    lines that share ingredients are not each checked against the full stock.
+    """
+    result = await inventory_service.check_cart_availability([(line.item_id, line.quantity) for line in cart.items])
+    return json_response(data=result, message="Stock availability check for cart")
+
+@router.get("/stock/max-makeable", summary="How many of each menu item can be made")
+async def get_max_makeable(item_ids: Optional[List[int]] = Query(None, description="Only these items")):
+    makeable = await inventory_service.get_max_makeable(item_ids)
+    return json_response(data=makeable, message="Maximum makeable quantities retrieved successfully")
+
 @router.put("/ingredients/{ingredient_id}/stock", summary="Update stock level")
 async def update_stock(ingredient_id: int, stock_update: schemas.StockUpdate):
     updated_ingredient = await inventory_service.update_stock_level(ingredient_id, stock_update.quantity)
     if not updated_ingredient:
         return error_response(message=f"Ingredient with ID {ingredient_id} not found", status_code=404)
-    return json_response(data=jsonable_encoder(updated_ingredient), message="Stock level updated successfully")
+    return json_response(data=updated_ingredient, message="Stock level updated successfully")
+
+@router.post("/ingredients/{ingredient_id}/stock/adjust", summary="Add to or take from stock atomically")
+async def adjust_stock(ingredient_id: int, stock_update: schemas.StockUpdate):
+    try:
+        updated_ingredient = await inventory_service.adjust_stock_level(ingredient_id, stock_update.quantity)
+    except stock_reservation.InsufficientStockError as e:
+        return error_response(message=str(e), status_code=400)
+    if not updated_ingredient:
+        return error_response(message=f"Ingredient with ID {ingredient_id} not found", status_code=404)
+    return json_response(data=updated_ingredient, message="Stock level adjusted successfully")
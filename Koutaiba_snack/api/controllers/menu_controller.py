@@ -1,42 +1,102 @@
 
-from fastapi import APIRouter, HTTPException
-from fastapi.encoders import jsonable_encoder
+from fastapi import APIRouter, Header, HTTPException, Query
 from api.services import menu_service
-from api.utils.responses import json_response, error_response
+from api.utils.pagination import DEFAULT_PAGE_SIZE, page_meta
+from api.utils.responses import json_response, error_response, prepared_json_response
 from api.models import schemas
+from typing import Optional
 
 router = APIRouter()
 
 @router.get("/menu", summary="Get complete menu")
-async def get_menu():
-    menu = await menu_service.get_full_menu()
-    return json_response(data=jsonable_encoder(menu), message="Complete menu retrieved successfully")
+async def get_menu(
+    limit: Optional[int] = Query(None, gt=0, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated item fields to return, e.g. id,name,price"),
+    include: Optional[str] = Query(None, description="Related records to embed: ingredients (the recipe)"),
+    if_none_match: Optional[str] = Header(None),
+):
+    try:
+        selection = menu_service.ITEM_FIELDS.select(fields, include)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    if limit or cursor:
+        try:
+            menu, next_cursor = await menu_service.get_menu_page(limit or DEFAULT_PAGE_SIZE, cursor, selection)
+        except ValueError as e:
+            return error_response(message=str(e), status_code=400)
+        return json_response(
+            data=menu,
+            message="Menu page retrieved successfully",
+            meta=page_meta(limit, cursor, next_cursor),
+        )
+    menu = await menu_service.get_payload("menu", selection)
+    return prepared_json_response(menu, message="Complete menu retrieved successfully", if_none_match=if_none_match)
 
 @router.get("/menu/categories", summary="List all categories")
-async def get_categories():
-    categories = await menu_service.get_all_categories()
-    return json_response(data=jsonable_encoder(categories), message="Categories retrieved successfully")
+async def get_categories(if_none_match: Optional[str] = Header(None)):
+    categories = await menu_service.get_payload("categories")
+    return prepared_json_response(categories, message="Categories retrieved successfully", if_none_match=if_none_match)
 
 @router.get("/menu/categories/{category_name}", summary="Get items by category")
-async def get_items_by_category(category_name: str):
-    items = await menu_service.get_items_by_category_name(category_name)
+async def get_items_by_category(
+    category_name: str,
+    fields: Optional[str] = Query(None, description="Comma-separated item fields to return, e.g. id,name,price"),
+    include: Optional[str] = Query(None, description="Related records to embed: ingredients (the recipe)"),
+):
+    try:
+        selection = menu_service.ITEM_FIELDS.select(fields, include)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    items = await menu_service.get_items_by_category_name(category_name, selection)
     if not items:
         return error_response(message=f"No items found for category: {category_name}", status_code=404)
-    return json_response(data=jsonable_encoder(items), message=f"Items for category '{category_name}' retrieved successfully")
+    return json_response(data=items, message=f"Items for category '{category_name}' retrieved successfully")
 
 @router.get("/menu/items/{item_id}", summary="Get specific item details")
-async def get_item(item_id: int):
-    item = await menu_service.get_item_by_id(item_id)
+async def get_item(
+    item_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated item fields to return, e.g. id,name,price"),
+    include: Optional[str] = Query(None, description="Related records to embed: ingredients (the recipe)"),
+    if_none_match: Optional[str] = Header(None),
+):
+    try:
+        selection = menu_service.ITEM_FIELDS.select(fields, include)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    item = await menu_service.get_item_payload(item_id, selection)
     if not item:
         return error_response(message=f"Item with ID {item_id} not found", status_code=404)
-    return json_response(data=jsonable_encoder(item), message="Item details retrieved successfully")
+    return prepared_json_response(item, message="Item details retrieved successfully", if_none_match=if_none_match)
 
 @router.get("/menu/search", summary="Search menu items")
-async def search_items(q: str):
-    items = await menu_service.search_menu_items(q)
-    return json_response(data=jsonable_encoder(items), message=f"Search results for '{q}'")
+async def search_items(
+    q: str,
+    limit: int = Query(20, gt=0, le=100),
+    fields: Optional[str] = Query(None, description="Comma-separated item fields to return, e.g. id,name,price"),
+    include: Optional[str] = Query(None, description="Related records to embed: ingredients (the recipe)"),
+):
+    try:
+        selection = menu_service.ITEM_FIELDS.select(fields, include)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    items = await menu_service.search_menu_items(q, limit, selection)
+    return json_response(data=items, message=f"Search results for '{q}'")
 
 @router.get("/menu/available", summary="Get only available items")
-async def get_available_items():
-    items = await menu_service.get_available_items()
-    return json_response(data=jsonable_encoder(items), message="Available items retrieved successfully")
+async def get_available_items(
+    fields: Optional[str] = Query(None, description="Comma-separated item fields to return, e.g. id,name,price"),
+    include: Optional[str] = Query(None, description="Related records to embed: ingredients (the recipe)"),
+    if_none_match: Optional[str] = Header(None),
+):
+    try:
+        selection = menu_service.ITEM_FIELDS.select(fields, include)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    items = await menu_service.get_payload("available", selection)
+    return prepared_json_response(items, message="Available items retrieved successfully", if_none_match=if_none_match)
+
+@router.post("/menu/cache/invalidate", summary="Reload the menu on the next request")
+async def invalidate_menu_cache():
+    menu_service.invalidate_cache()
+    return json_response(message="Menu cache invalidated")
@@ -1,46 +1,245 @@
 
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.encoders import jsonable_encoder
-from api.services import order_service
+import hashlib
+import os
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from api.services import order_events, order_intake, order_service
+from api.utils.events import format_event, stream_events
+from api.utils.idempotency import MAX_KEY_LENGTH, IdempotencyStore, KeyReused, StoredResponse
+from api.utils.pagination import page_meta
 from api.utils.responses import json_response, error_response
+from api.utils.serialization import dumps
 from api.models import schemas
-from typing import Optional
+from typing import List, Optional
 
 router = APIRouter()
 
-@router.post("/orders", summary="Create new order")
-async def create_order(order_data: schemas.OrderCreate):
+_created_orders = IdempotencyStore(
+    "orders",
+    max_keys=int(os.environ.get("IDEMPOTENCY_MAX_KEYS", 10000)),
+    ttl=float(os.environ.get("IDEMPOTENCY_TTL", 86400)),
+)
+
+# Most orders a stream subscriber gets in its snapshot, newest first.
+SNAPSHOT_LIMIT = int(os.environ.get("ORDER_STREAM_SNAPSHOT_LIMIT", 200))
+
+# Headers of a create response that are replayed with it.
+_REPLAYED_HEADERS = ("location", "preference-applied")
+
+def _respond_async(prefer: Optional[str]) -> bool:
+    """Whether a Prefer header (RFC 7240) asks for `respond-async`."""
+    return prefer is not None and any(
+        preference.split(";")[0].strip().lower() == "respond-async" for preference in prefer.split(",")
+    )
+
+def _intake_data(entry: dict) -> dict:
+    return {
+        "intake_id": entry['id'],
+        "status": entry['status'],
+        "order_id": entry.get('order_id'),
+        "error": entry.get('error'),
+        "created_at": entry['created_at'],
+        "finished_at": entry.get('finished_at'),
+        "status_url": f"/orders/intake/{entry['id']}",
+    }
+
+async def _create_order(order_data: schemas.OrderCreate, respond_async: bool = False) -> Response:
     try:
+        if respond_async:
+            entry = await order_intake.enqueue(order_data)
+            data = _intake_data(entry)
+            response = json_response(data=data, message="Order accepted, it will be created shortly", status_code=202)
+            response.headers["Location"] = data['status_url']
+            response.headers["Preference-Applied"] = "respond-async"
+            return response
         order = await order_service.create_order(order_data)
-        return json_response(data=jsonable_encoder(order), message="Order created successfully", status_code=201)
+        return json_response(data=order, message="Order created successfully", status_code=201)
     except HTTPException as e:
         return error_response(message=e.detail, status_code=e.status_code)
 
+@router.post("/orders", summary="Create new order")
+async def create_order(
+    order_data: schemas.OrderCreate,
+    idempotency_key: Optional[str] = Header(None),
+    prefer: Optional[str] = Header(None),
+):
+    """
+    With an Idempotency-Key header, a retry of the same order is answered
+    with the original response (marked `Idempotent-Replayed: true`) instead
+    of creating the order again.
+
+    With `Prefer: respond-async` the order is only validated and queued, and
+    answered with 202 and an intake handle; poll `GET /orders/intake/{intake_id}`
+    (see its Location header) for the created order.
+    """
+    respond_async = _respond_async(prefer)
+    if idempotency_key is None:
+        return await _create_order(order_data, respond_async)
+    if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+        return error_response(message=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters", status_code=400)
+
+    async def handler() -> StoredResponse:
+        response = await _create_order(order_data, respond_async)
+        headers = tuple((name, value) for name, value in response.headers.items() if name in _REPLAYED_HEADERS)
+        return StoredResponse(response.status_code, response.body, headers)
+
+    fingerprint = hashlib.blake2b(dumps(order_data), digest_size=16).hexdigest()
+    try:
+        stored, replayed = await _created_orders.run(idempotency_key, fingerprint, handler)
+    except KeyReused:
+        return error_response(message="Idempotency-Key was already used for a different order", status_code=422)
+    headers = dict(stored.headers)
+    if replayed:
+        headers["Idempotent-Replayed"] = "true"
+    return Response(content=stored.body, status_code=stored.status_code, media_type="application/json", headers=headers)
+
+@router.get("/orders/intake/{intake_id}", summary="Get the status of an asynchronously placed order")
+async def get_order_intake(intake_id: int, wait: float = Query(0, ge=0, le=30, description="Seconds to wait for the order to be processed")):
+    """
+    `queued` until a fulfilment worker has processed the order, then
+    `created` (with `order_id` and the `order`) or `rejected`/`failed` (with
+    the `error`). With `wait`, answers as soon as the order is processed or
+    after that many seconds, whichever comes first.
+    """
+    entry = await order_intake.wait_for(intake_id, wait)
+    if entry is None:
+        return error_response(message=f"Order intake {intake_id} not found", status_code=404)
+    data = _intake_data(entry)
+    if entry['order_id'] is not None:
+        data['order'] = await order_service.get_order_by_id(entry['order_id'], order_service.ORDER_FIELDS.select(default_include=("items",)))
+    return json_response(data=data, message=f"Order intake is {entry['status']}")
+
 @router.get("/orders", summary="List all orders")
-async def get_orders(status: Optional[str] = Query(None)):
-    orders = await order_service.get_all_orders(status)
-    return json_response(data=jsonable_encoder(orders), message="Orders retrieved successfully")
+async def get_orders(
+    status: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, gt=0, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,status,table_number"),
+    include: Optional[str] = Query(None, description="Related records to embed: items"),
+):
+    try:
+        selection = order_service.ORDER_FIELDS.select(fields, include)
+        orders, next_cursor = await order_service.get_all_orders(status, limit, cursor, selection)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    return json_response(data=orders, message="Orders retrieved successfully", meta=page_meta(limit, cursor, next_cursor))
+
+@router.get("/orders/stream", summary="Stream order lifecycle events (Server-Sent Events)")
+async def stream_orders(
+    request: Request,
+    status: Optional[List[str]] = Query(None, description="Only orders entering or leaving these statuses"),
+    since: Optional[int] = Query(None, description="Resume after this event id"),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Sends `order_created` and `order_status_changed` events as they happen.
+
+    A new subscriber first gets a `snapshot` event with the newest
+    SNAPSHOT_LIMIT orders currently in the requested statuses, or in any
+    status but a final one when none is given, and whether there were more
+    (`truncated`). A reconnecting one (`since` or the
+    Last-Event-ID header) gets the events it missed instead, or a `reset`
+    event followed by a fresh snapshot if it fell too far behind.
+    """
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    statuses = set(status or [])
+
+    def wanted(data: dict) -> bool:
+        return not statuses or order_events.matches(statuses, data)
+
+    async def events():
+        # Subscribe before reading the snapshot or backlog, so nothing falls in between.
+        with order_events.hub.subscribe() as queue:
+            initial, replayed = [], set()
+            missed = await order_events.replay(since) if since is not None else None
+            if missed is None:
+                if since is not None:
+                    initial.append(format_event("reset", {"since": since}))
+                seq = await order_events.latest_seq()
+                orders, truncated = await order_service.get_recent_orders(statuses, SNAPSHOT_LIMIT)
+                initial.append(format_event("snapshot", {"seq": seq, "orders": orders, "truncated": truncated}, seq or None))
+            else:
+                for event in missed:
+                    replayed.add(event.id)
+                    if wanted(event.data):
+                        initial.append(event.encoded)
+
+            def accept(event) -> bool:
+                return event.id not in replayed and wanted(event.data)
+
+            async for chunk in stream_events(queue, initial, request.is_disconnected, accept=accept):
+                yield chunk
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @router.get("/orders/{order_id}", summary="Get order details")
-async def get_order(order_id: int):
-    order = await order_service.get_order_by_id(order_id)
+async def get_order(
+    order_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,status,table_number"),
+    include: Optional[str] = Query(None, description="Related records to embed (default: items)"),
+):
+    try:
+        selection = order_service.ORDER_FIELDS.select(fields, include, default_include=("items",))
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    order = await order_service.get_order_by_id(order_id, selection)
     if not order:
         return error_response(message=f"Order with ID {order_id} not found", status_code=404)
-    return json_response(data=jsonable_encoder(order), message="Order details retrieved successfully")
+    return json_response(data=order, message="Order details retrieved successfully")
 
 @router.get("/orders/status/{status}", summary="Get orders by status")
-async def get_orders_by_status(status: str):
-    orders = await order_service.get_orders_by_status(status)
-    return json_response(data=jsonable_encoder(orders), message=f"Orders with status '{status}' retrieved successfully")
+async def get_orders_by_status(
+    status: str,
+    limit: Optional[int] = Query(None, gt=0, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,status,table_number"),
+    include: Optional[str] = Query(None, description="Related records to embed: items"),
+):
+    try:
+        selection = order_service.ORDER_FIELDS.select(fields, include)
+        orders, next_cursor = await order_service.get_orders_by_status(status, limit, cursor, selection)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    return json_response(data=orders, message=f"Orders with status '{status}' retrieved successfully", meta=page_meta(limit, cursor, next_cursor))
 
 @router.get("/orders/customer/{customer_name}", summary="Get order history by customer")
-async def get_orders_by_customer(customer_name: str):
-    orders = await order_service.get_orders_by_customer(customer_name)
-    return json_response(data=jsonable_encoder(orders), message=f"Order history for '{customer_name}' retrieved successfully")
+async def get_orders_by_customer(
+    customer_name: str,
+    limit: int = Query(50, gt=0, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    prefix: bool = Query(False, description="Match every customer whose name starts with customer_name"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,status,table_number"),
+    include: Optional[str] = Query(None, description="Related records to embed: items"),
+):
+    """Most recent orders first. Names match ignoring case and extra spaces, and whole names only unless `prefix` is set."""
+    try:
+        selection = order_service.ORDER_FIELDS.select(fields, include)
+        orders, next_cursor = await order_service.get_orders_by_customer(customer_name, limit, cursor, selection, prefix)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    return json_response(data=orders, message=f"Order history for '{customer_name}' retrieved successfully", meta=page_meta(limit, cursor, next_cursor))
+
+@router.get("/orders/phone/{phone}", summary="Get order history by phone number")
+async def get_orders_by_phone(
+    phone: str,
+    limit: int = Query(50, gt=0, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    prefix: bool = Query(False, description="Match every number starting with these digits"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,status,table_number"),
+    include: Optional[str] = Query(None, description="Related records to embed: items"),
+):
+    """Most recent orders first. Numbers are compared by their digits only, so "+33 6 12-34" matches "33612 34"."""
+    try:
+        selection = order_service.ORDER_FIELDS.select(fields, include)
+        orders, next_cursor = await order_service.get_orders_by_phone(phone, limit, cursor, selection, prefix)
+    except ValueError as e:
+        return error_response(message=str(e), status_code=400)
+    return json_response(data=orders, message=f"Order history for phone '{phone}' retrieved successfully", meta=page_meta(limit, cursor, next_cursor))
 
 @router.put("/orders/{order_id}/status", summary="Update order status")
 async def update_order_status(order_id: int, status_update: schemas.OrderUpdateStatus):
     updated_order = await order_service.update_order_status(order_id, status_update.status)
     if not updated_order:
         return error_response(message=f"Order with ID {order_id} not found", status_code=404)
-    return json_response(data=jsonable_encoder(updated_order), message="Order status updated successfully")
+    return json_response(data=updated_order, message="Order status updated successfully")
@@ -0,0 +1,241 @@
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import asyncpg
+from dotenv import load_dotenv
+
+from api.database import local
+from api.utils import metrics
+from api.utils.log import get_logger
+
+load_dotenv()
+
+_pool: Optional[asyncpg.Pool] = None
+_dsn: Optional[str] = None
+_listener: Optional[asyncpg.Connection] = None
+
+logger = get_logger(__name__)
+
+# Calls slower than this are logged as warnings, in addition to the histogram.
+SLOW_QUERY_SECONDS = float(os.environ.get("DB_SLOW_QUERY_SECONDS", 0.5))
+
+# Errors after which a transaction can simply be run again (deadlock, serialization failure).
+TransientError = asyncpg.TransactionRollbackError
+
+_OPERATION_RE = re.compile(r"^\s*(?:WITH\b.*?\)\s*)?(SELECT|INSERT|UPDATE|DELETE|LOCK|CREATE|DROP|ALTER)\b", re.IGNORECASE | re.DOTALL)
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+([\w.]+)", re.IGNORECASE)
+_WRITE_RE = re.compile(r"\b(INSERT)\s+INTO\s+([\w.]+)|(?<!FOR )\b(UPDATE)\s+([\w.]+)\s+SET\b|\b(DELETE)\s+FROM\s+([\w.]+)", re.IGNORECASE)
+
+
+def _top_level(query: str) -> str:
+    """Blanks out everything inside parentheses, so subqueries and extract(... FROM ...) are ignored."""
+    depth, chars = 0, []
+    for char in query:
+        if char == "(":
+            depth += 1
+        chars.append(char if depth == 0 else " ")
+        if char == ")" and depth:
+            depth -= 1
+    return "".join(chars)
+
+
+@lru_cache(maxsize=512)
+def describe(query: str) -> Tuple[str, str]:
+    """Returns the (operation, table) a query is tagged with, e.g. ("select", "orders")."""
+    if query.lstrip()[:4].upper() == "WITH":
+        # A data-modifying CTE is tagged with the write it performs.
+        write = _WRITE_RE.search(query)
+        if write:
+            groups = [group for group in write.groups() if group]
+            return groups[0].lower(), groups[1].lower()
+    operation = _OPERATION_RE.match(query)
+    # Skip past a leading CTE so "WITH x AS (...) SELECT ... FROM t" is tagged with t.
+    table = _TABLE_RE.search(_top_level(query), operation.start(1) if operation else 0)
+    return (
+        operation.group(1).lower() if operation else "other",
+        table.group(1).lower() if table else "none",
+    )
+
+
+@asynccontextmanager
+async def span(query: str):
+    """Times one database call into the db_query_duration_seconds histogram."""
+    operation, table = describe(query)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.db_errors.inc(operation, table)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.db_latency.observe(operation, table, value=elapsed)
+        if elapsed >= SLOW_QUERY_SECONDS:
+            logger.warning("slow query", extra={"operation": operation, "table": table, "seconds": round(elapsed, 4)})
+
+
+class Connection:
+    """
+    Thin wrapper around a pooled asyncpg connection that returns plain dicts,
+    so services can keep passing rows straight into the Pydantic schemas.
+    """
+
+    def __init__(self, conn: asyncpg.Connection):
+        self._conn = conn
+
+    async def fetch(self, query: str, *args: Any) -> List[dict]:
+        async with span(query):
+            rows = await self._conn.fetch(query, *args)
+        return [dict(row) for row in rows]
+
+    async def fetchrow(self, query: str, *args: Any) -> Optional[dict]:
+        async with span(query):
+            row = await self._conn.fetchrow(query, *args)
+        return dict(row) if row is not None else None
+
+    async def fetchval(self, query: str, *args: Any) -> Any:
+        async with span(query):
+            return await self._conn.fetchval(query, *args)
+
+    async def execute(self, query: str, *args: Any) -> str:
+        async with span(query):
+            return await self._conn.execute(query, *args)
+
+    def savepoint(self):
+        """
+        A nested transaction for `async with`: an exception inside rolls back
+        only the block, and the surrounding transaction can carry on.
+        """
+        return self._conn.transaction()
+
+
+async def init_pool(dsn: Optional[str] = None, **options: Any) -> asyncpg.Pool:
+    """
+    Opens the shared connection pool.
+
+    The pool size is the concurrency bound for the whole worker: at most
+    DB_POOL_MAX_SIZE queries run at once, further callers wait up to
+    DB_ACQUIRE_TIMEOUT seconds for a free connection.
+
+    Args:
+        dsn: Postgres connection string. Defaults to the DATABASE_URL env var.
+            "local://" or "local:///data/dir" starts an embedded Postgres
+            instead, see `api.database.local`.
+        **options: Extra asyncpg.create_pool arguments, e.g. server_settings.
+
+    Returns:
+        The asyncpg pool.
+    """
+    global _pool, _dsn
+    if _pool is None:
+        _dsn = dsn or os.environ.get("DATABASE_URL")
+        if not _dsn:
+            raise RuntimeError("DATABASE_URL is not set")
+        if local.is_local(_dsn):
+            _dsn = await local.resolve(_dsn)
+        _pool = await asyncpg.create_pool(
+            dsn=_dsn,
+            min_size=int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+            max_size=int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+            command_timeout=float(os.environ.get("DB_COMMAND_TIMEOUT", 10)),
+            # The Supabase transaction pooler (port 6543) does not support
+            # prepared statements, set this to 0 when connecting through it.
+            statement_cache_size=int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100)),
+            **options,
+        )
+    return _pool
+
+
+async def close_pool() -> None:
+    global _pool, _listener
+    if _listener is not None:
+        await _listener.close()
+        _listener = None
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def listen(channel: str, callback: Callable[[str], None]) -> None:
+    """
+    Calls `callback(payload)` for every NOTIFY on `channel`.
+
+    LISTEN needs a session of its own, so all channels share one dedicated
+    connection outside the pool; it is closed together with the pool.
+    """
+    global _listener
+    if _listener is None or _listener.is_closed():
+        _listener = await asyncpg.connect(_dsn or os.environ.get("DATABASE_URL"))
+    await _listener.add_listener(channel, lambda _conn, _pid, _channel, payload: callback(payload))
+
+
+@asynccontextmanager
+async def connection():
+    """Acquires a pooled connection for the duration of the block."""
+    pool = await init_pool()
+    timeout = float(os.environ.get("DB_ACQUIRE_TIMEOUT", 5))
+    async with pool.acquire(timeout=timeout) as conn:
+        yield Connection(conn)
+
+
+@asynccontextmanager
+async def transaction():
+    """Acquires a pooled connection and runs the block in a single transaction."""
+    async with connection() as conn:
+        async with conn._conn.transaction():
+            yield conn
+
+
+async def fetch(query: str, *args: Any) -> List[dict]:
+    async with connection() as conn:
+        return await conn.fetch(query, *args)
+
+
+async def fetchrow(query: str, *args: Any) -> Optional[dict]:
+    async with connection() as conn:
+        return await conn.fetchrow(query, *args)
+
+
+async def fetchval(query: str, *args: Any) -> Any:
+    async with connection() as conn:
+        return await conn.fetchval(query, *args)
+
+
+async def execute(query: str, *args: Any) -> str:
+    async with connection() as conn:
+        return await conn.execute(query, *args)
+
+
+def placeholders(count: int, start: int = 1) -> str:
+    """Returns "$start, $start+1, ..." for an IN (...) list of `count` values."""
+    return ", ".join(f"${i}" for i in range(start, start + count))
+
+
+def values_rows(rows: Sequence[Sequence[Any]], casts: Sequence[str] = (), start: int = 1) -> tuple:
+    """
+    Builds a multi-row VALUES list so a whole batch goes out in one statement.
+
+    Args:
+        rows: The rows to bind, all of the same width.
+        casts: Optional Postgres type per column (e.g. "int", "numeric"), needed
+            when the VALUES list is not the target of an INSERT.
+        start: Number of the first placeholder.
+
+    Returns:
+        A (sql, args) tuple, e.g. ("($1::int, $2::numeric), ($3::int, $4::numeric)", [...]).
+    """
+    sql_rows, args = [], []
+    index = start
+    for row in rows:
+        cells = []
+        for column, value in enumerate(row):
+            cast = f"::{casts[column]}" if column < len(casts) and casts[column] else ""
+            cells.append(f"${index}{cast}")
+            args.append(value)
+            index += 1
+        sql_rows.append(f"({', '.join(cells)})")
+    return ", ".join(sql_rows), args
@@ -0,0 +1,62 @@
+
+import asyncio
+import tempfile
+from pathlib import Path
+from typing import List
+
+import asyncpg
+
+SCHEME = "local://"
+SQL_DIR = Path(__file__).resolve().parents[2] / "sql"
+
+# Keeps the embedded servers alive for as long as the process runs.
+_servers: List[object] = []
+
+
+def is_local(dsn: str) -> bool:
+    return bool(dsn) and dsn.startswith(SCHEME)
+
+
+async def resolve(dsn: str) -> str:
+    """
+    Starts the embedded Postgres behind a local:// DSN and returns its real DSN.
+
+    `local://` runs a throwaway server in a temporary directory that is deleted
+    on exit; `local:///some/dir` keeps its data in that directory between runs.
+    Every file in sql/ that the database hasn't seen yet is applied, so the
+    stand-in has the same tables, triggers and rollups as production.
+
+    The services speak Postgres SQL (row locks, casts, triggers), so the
+    stand-in is a real Postgres started from the pgserver package rather
+    than SQLite; it needs no network or Supabase project.
+    """
+    # Imported here: pgserver (and psutil with it) is only needed for local://.
+    try:
+        import pgserver
+    except ImportError:
+        raise RuntimeError("DATABASE_URL=local:// needs the pgserver package: pip install pgserver") from None
+    path = dsn[len(SCHEME):]
+    if path:
+        Path(path).mkdir(parents=True, exist_ok=True)
+        server = await asyncio.to_thread(pgserver.get_server, path, cleanup_mode="stop")
+    else:
+        server = await asyncio.to_thread(pgserver.get_server, tempfile.mkdtemp(prefix="koutaiba-db-"), cleanup_mode="delete")
+    _servers.append(server)
+    uri = server.get_uri()
+    await apply_migrations(uri)
+    return uri
+
+
+async def apply_migrations(dsn: str) -> List[str]:
+    """Applies the sql/ files not yet recorded in schema_migrations, in file order."""
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute("CREATE TABLE IF NOT EXISTS schema_migrations (name text PRIMARY KEY, applied_at timestamptz NOT NULL DEFAULT now())")
+        applied = {row['name'] for row in await conn.fetch("SELECT name FROM schema_migrations")}
+        pending = [path for path in sorted(SQL_DIR.glob("*.sql")) if path.name not in applied]
+        for path in pending:
+            await conn.execute(path.read_text())
+            await conn.execute("INSERT INTO schema_migrations (name) VALUES ($1)", path.name)
+        return [path.name for path in pending]
+    finally:
+        await conn.close()
@@ -1,9 +1,26 @@
 import os
-from supabase import create_client, Client
+from functools import lru_cache
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from supabase import Client
+
 load_dotenv()
 
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
\ No newline at end of file
+
+
+@lru_cache(maxsize=None)
+def get_client() -> "Client":
+    """Creates the Supabase client on first use instead of at import time."""
+    from supabase import create_client
+    return create_client(url, key)
+
+
+def __getattr__(name: str):
+    # Keeps `from api.database.supabase_conn import supabase` working.
+    if name == "supabase":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
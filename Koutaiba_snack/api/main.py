@@ -1,11 +1,70 @@
-import app
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import Response
+from api.database import db
+from api.services import menu_service, order_events, order_intake, order_timeseries, popularity, recipe_matrix, revenue_counters, stock_alerts
+from api.utils import metrics
+from api.utils.compression import CompressionMiddleware
+from api.utils.log import configure_logging, get_logger
+from api.utils.responses import error_response, json_response
+
+configure_logging()
+logger = get_logger(__name__)
+
+# Set once the lifespan has warmed every cache, cleared again on shutdown.
+_ready = False
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _ready
+    started = time.perf_counter()
+    # Any failure here aborts startup, so a broken deploy never takes traffic.
+    await db.init_pool()
+    try:
+        await db.listen("menu_changed", menu_service.invalidate_cache)
+        await db.listen("menu_changed", recipe_matrix.invalidate)
+        await db.listen("stock_changed", recipe_matrix.apply_stock_notification)
+        await db.listen(stock_alerts.CHANNEL, stock_alerts.on_notification)
+        await db.listen(order_events.CHANNEL, order_events.on_notification)
+        await db.listen(order_events.CHANNEL, order_timeseries.on_order_event)
+        await db.listen(order_intake.QUEUED_CHANNEL, order_intake.on_queued)
+        await db.listen(order_intake.CHANNEL, order_intake.on_notification)
+    except Exception as e:
+        # Without the listener the menu cache and recipe matrix still expire
+        # after MENU_CACHE_TTL and RECIPE_MATRIX_TTL, but no stock alerts or
+        # order events are pushed, and intake workers poll every
+        # ORDER_INTAKE_POLL_SECONDS.
+        logger.warning("could not listen for database notifications", extra={"error": str(e)})
+    # Warm everything the first requests would otherwise load, in parallel.
+    await asyncio.gather(
+        menu_service.warm(),
+        recipe_matrix.get_matrix(),
+        revenue_counters.rebuild(),
+        popularity.rebuild(),
+        order_events.prune(),
+        order_intake.prune(),
+    )
+    order_intake.start()
+    _ready = True
+    logger.info("ready", extra={"startup_seconds": round(time.perf_counter() - started, 3)})
+    yield
+    _ready = False
+    await order_intake.stop()
+    await db.close_pool()
+
 
 app = FastAPI(
     title="Koutaiba Snack Restaurant Management System",
     description="A FastAPI backend for managing a restaurant, designed for LLM and MCP integration.",
     version="1.0.0",
+    lifespan=lifespan,
 )
+app.add_middleware(CompressionMiddleware)
+# Added last so it is outermost and times compression too.
+app.add_middleware(metrics.MetricsMiddleware)
 from api.controllers import menu_controller, order_controller, inventory_controller, customer_controller
 
 
@@ -15,7 +74,21 @@ app.include_router(order_controller.router, tags=["Orders"])
 app.include_router(inventory_controller.router, tags=["Inventory"])
 app.include_router(customer_controller.router, tags=["Customer Analytics"])
 
+@app.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+async def get_metrics():
+    pool = db._pool
+    if pool is not None:
+        metrics.db_pool_connections.set("idle", value=pool.get_idle_size())
+        metrics.db_pool_connections.set("busy", value=pool.get_size() - pool.get_idle_size())
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/ready", summary="Readiness probe", include_in_schema=False)
+async def get_ready():
+    """200 once the pool is open and the caches are warm, 503 before that and while shutting down."""
+    if not _ready:
+        return error_response(message="Starting up", status_code=503)
+    return json_response(data={"ready": True}, message="Ready")
+
 @app.get("/", summary="Root endpoint")
 async def root():
     return {"message": "Welcome to the Koutaiba Snack Restaurant Management System API"}
-
@@ -1,40 +1,66 @@
 
-from api.database.supabase_conn import supabase
+from datetime import datetime, timedelta, timezone
+from api.database import db
 from api.models import schemas
-from typing import List
+from api.services import menu_service, popularity, revenue_counters
+from api.utils.pagination import decode_cursor, paginate
+from typing import List, Optional, Tuple
 
-async def get_all_customers() -> List[schemas.Customer]:
-    response = supabase.from_("orders").select("customer_name", "customer_phone").execute()
-    return [schemas.Customer(**row) for row in response.data]
+async def get_all_customers(limit: int = 50, cursor: str = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Returns one page of unique customers, most recent order first, and the
+    cursor of the next page (None on the last page).
+    """
+    last_order_at = customer_key = None
+    if cursor:
+        last_order_at, customer_key = decode_cursor(cursor, 2)
+        if not isinstance(customer_key, str):
+            raise ValueError("Invalid cursor")
+        try:
+            last_order_at = datetime.fromisoformat(last_order_at)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+    rows = await db.fetch(
+        "SELECT customer_key, customer_name, customer_phone, order_count, first_order_at, last_order_at "
+        "FROM customer_directory "
+        "WHERE $1::timestamptz IS NULL OR (last_order_at, customer_key) < ($1::timestamptz, $2::text) "
+        "ORDER BY last_order_at DESC, customer_key DESC LIMIT $3",
+        last_order_at, customer_key, limit + 1,
+    )
+    rows, next_cursor = paginate(rows, limit, lambda row: [row['last_order_at'].isoformat(), row['customer_key']])
+    for row in rows:
+        del row['customer_key']
+    return rows, next_cursor
 
-async def get_popular_items() -> List[schemas.PopularItem]:
-    response = supabase.from_("order_items").select("item_id, items(name)").execute()
-    item_counts = {}
-    for row in response.data:
-        item_id = row['item_id']
-        item_name = row['items']['name']
-        if item_id not in item_counts:
-            item_counts[item_id] = {"name": item_name, "total_orders": 0}
-        item_counts[item_id]["total_orders"] += 1
+async def get_popular_items(k: int = 10, days: int = None, category: str = None) -> List[schemas.PopularItem]:
+    await popularity.ensure_fresh()
+    snapshot = await menu_service.get_snapshot()
+    item_ids = None
+    if category:
+        item_ids = {item.id for item in snapshot.items_by_category.get(category, [])}
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).date() if days else None
 
-    popular_items = sorted(item_counts.items(), key=lambda x: x[1]['total_orders'], reverse=True)[:10]
+    popular_items = popularity.counters.top(k, since=since, item_ids=item_ids)
 
-    return [schemas.PopularItem(item_id=item_id, name=data['name'], total_orders=data['total_orders']) for item_id, data in popular_items]
+    return [
+        schemas.PopularItem(item_id=item_id, name=snapshot.items_by_id[item_id].name if item_id in snapshot.items_by_id else "", total_orders=quantity)
+        for item_id, quantity, _ in popular_items
+    ]
 
 async def get_revenue_stats() -> schemas.RevenueStats:
-    from datetime import datetime, timedelta
-
-    now = datetime.now()
-    one_day_ago = now - timedelta(days=1)
-    one_week_ago = now - timedelta(weeks=1)
-    one_month_ago = now - timedelta(days=30)
-
-    daily_revenue = supabase.from_("orders").select("total_amount").gte("created_at", one_day_ago.isoformat()).execute()
-    weekly_revenue = supabase.from_("orders").select("total_amount").gte("created_at", one_week_ago.isoformat()).execute()
-    monthly_revenue = supabase.from_("orders").select("total_amount").gte("created_at", one_month_ago.isoformat()).execute()
-
-    daily = sum([row['total_amount'] for row in daily_revenue.data])
-    weekly = sum([row['total_amount'] for row in weekly_revenue.data])
-    monthly = sum([row['total_amount'] for row in monthly_revenue.data])
+    await revenue_counters.ensure_fresh()
+    now = datetime.now(timezone.utc)
+    daily, _ = revenue_counters.counters.window(now - timedelta(days=1))
+    weekly, _ = revenue_counters.counters.window(now - timedelta(weeks=1))
+    monthly, _ = revenue_counters.counters.window(now - timedelta(days=30))
 
     return schemas.RevenueStats(daily=daily, weekly=weekly, monthly=monthly)
+
+async def get_revenue_for_window(start: datetime, end: datetime = None) -> dict:
+    if start < datetime.now(timezone.utc) - revenue_counters.counters.retention:
+        # Older than the buckets go back, aggregate it in the database instead
+        revenue, orders = await revenue_counters.query_window(start, end)
+    else:
+        await revenue_counters.ensure_fresh()
+        revenue, orders = await revenue_counters.exact_window(start, end)
+    return {"start": start, "end": end, "revenue": revenue, "orders": orders}
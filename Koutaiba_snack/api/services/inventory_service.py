@@ -1,39 +1,157 @@
 
-from api.database.supabase_conn import supabase
+from api.database import db
 from api.models import schemas
-from typing import List
+from api.services import recipe_matrix, stock_reservation
+from api.utils.fields import Fields, Selection
+from api.utils.pagination import DEFAULT_PAGE_SIZE, decode_cursor, paginate
+from api.utils.serialization import construct
+from api.utils.singleflight import SingleFlight
+from typing import List, Optional, Tuple
 
-async def get_all_ingredients() -> List[schemas.Ingredient]:
-    response = supabase.from_("ingredients").select("*").order("name").execute()
-    return [schemas.Ingredient(**row) for row in response.data]
+# Concurrent identical reads share one query; stock writes below detach the
+# queries in flight so later reads see them.
+_reads = SingleFlight("inventory")
 
-async def get_ingredient_by_id(ingredient_id: int) -> schemas.Ingredient:
-    response = supabase.from_("ingredients").select("*").eq("id", ingredient_id).execute()
-    if response.data:
-        return schemas.Ingredient(**response.data[0])
+INGREDIENT_FIELDS = Fields(("id", "name", "unit", "current_stock", "min_stock_level"), relations=("items",))
+
+
+async def _fetch_ingredients(query: str, args: list, selection: Selection) -> List[dict]:
+    rows = await db.fetch(query, *args)
+    if "items" in selection.include and rows:
+        # The menu items each ingredient goes into, for the whole page in one query.
+        items = {row['id']: [] for row in rows}
+        for item in await db.fetch(
+            "SELECT ii.ingredient_id, ii.item_id, i.name, ii.quantity_required FROM item_ingredients ii "
+            "JOIN items i ON i.id = ii.item_id WHERE ii.ingredient_id = ANY($1::int[]) ORDER BY i.name, i.id",
+            list(items),
+        ):
+            items[item.pop('ingredient_id')].append(item)
+        for row in rows:
+            row['items'] = items[row['id']]
+    return rows
+
+def _shape(rows: List[dict], selection: Selection) -> list:
+    if selection.columns is None and not selection.include:
+        return [construct(schemas.Ingredient, row) for row in rows]
+    return [selection.project(row) for row in rows]
+
+async def get_all_ingredients(limit: int = None, cursor: str = None, selection: Selection = None) -> Tuple[List[schemas.Ingredient], Optional[str]]:
+    selection = selection or INGREDIENT_FIELDS.all
+    args = []
+    query = f"SELECT {selection.sql('name', 'id')} FROM ingredients"
+    if cursor:
+        limit = limit or DEFAULT_PAGE_SIZE
+        name, ingredient_id = decode_cursor(cursor, 2)
+        if not isinstance(name, str) or not isinstance(ingredient_id, int):
+            raise ValueError("Invalid cursor")
+        args += [name, ingredient_id]
+        query += " WHERE (name, id) > ($1::text, $2::int)"
+    query += " ORDER BY name, id"
+    if limit:
+        args.append(limit + 1)
+        query += f" LIMIT ${len(args)}"
+    rows = await _reads.do(("ingredients", limit, cursor, selection), lambda: _fetch_ingredients(query, args, selection))
+    rows, next_cursor = paginate(rows, limit, lambda row: [row['name'], row['id']])
+    return _shape(rows, selection), next_cursor
+
+async def get_ingredient_by_id(ingredient_id: int, selection: Selection = None) -> schemas.Ingredient:
+    selection = selection or INGREDIENT_FIELDS.all
+    query = f"SELECT {selection.sql()} FROM ingredients WHERE id = $1"
+    rows = await _reads.do(("ingredient", ingredient_id, selection), lambda: _fetch_ingredients(query, [ingredient_id], selection))
+    if rows:
+        return _shape(rows, selection)[0]
     return None
 
 async def get_ingredients_for_item(item_id: int) -> List[dict]:
-    response = supabase.from_("item_ingredients").select("quantity_required, ingredients(name, unit)").eq("item_id", item_id).execute()
-    return [{"name": row['ingredients']['name'], "quantity_required": row['quantity_required'], "unit": row['ingredients']['unit']} for row in response.data]
+    return await _reads.do(("item_ingredients", item_id), lambda: db.fetch(
+        "SELECT g.name, ii.quantity_required, g.unit FROM item_ingredients ii "
+        "JOIN ingredients g ON g.id = ii.ingredient_id WHERE ii.item_id = $1",
+        item_id,
+    ))
 
-async def get_low_stock_ingredients() -> List[schemas.Ingredient]:
-    response = supabase.from_("ingredients").select("*").order("name").execute()
-    low_stock_ingredients = [schemas.Ingredient(**row) for row in response.data if row['current_stock'] <= row['min_stock_level']]
-    return low_stock_ingredients
+async def get_low_stock_ingredients(selection: Selection = None) -> List[schemas.Ingredient]:
+    selection = selection or INGREDIENT_FIELDS.all
+    query = f"SELECT {selection.sql()} FROM ingredients WHERE current_stock <= min_stock_level ORDER BY name"
+    rows = await _reads.do(("low_stock", selection), lambda: _fetch_ingredients(query, [], selection))
+    return _shape(rows, selection)
 
 async def check_item_availability(item_id: int, quantity: int) -> bool:
-    response = supabase.from_("item_ingredients").select("quantity_required, ingredients(current_stock)").eq("item_id", item_id).execute()
-    if not response.data:
-        return False  # Item has no ingredients
+    # Items without ingredients can't be made
+    return (await recipe_matrix.check_cart({item_id: quantity}))['can_be_made']
+
+async def check_cart_availability(cart: List[Tuple[int, int]]) -> dict:
+    """
+    Checks a whole cart against current stock, counting ingredients shared
+    between its lines once. Takes (item_id, quantity) pairs.
+    """
+    quantities = {}
+    for item_id, quantity in cart:
+        quantities[item_id] = quantities.get(item_id, 0) + quantity
+    return await recipe_matrix.check_cart(quantities)
 
-    for row in response.data:
-        if row['ingredients']['current_stock'] < row['quantity_required'] * quantity:
-            return False
-    return True
+async def get_max_makeable(item_ids: Optional[List[int]] = None) -> List[dict]:
+    return await recipe_matrix.get_max_makeable(item_ids)
 
 async def update_stock_level(ingredient_id: int, new_quantity: float) -> schemas.Ingredient:
-    response = supabase.from_("ingredients").update({"current_stock": new_quantity}).eq("id", ingredient_id).execute()
-    if response.data:
-        return schemas.Ingredient(**response.data[0])
+    async with db.transaction() as conn:
+        row = await stock_reservation.set_level(conn, ingredient_id, new_quantity)
+    _reads.forget()
+    if row:
+        recipe_matrix.record_stock([row])
+        return construct(schemas.Ingredient, row)
     return None
+
+async def adjust_stock_level(ingredient_id: int, delta: float) -> schemas.Ingredient:
+    async with db.transaction() as conn:
+        row = await stock_reservation.adjust(conn, ingredient_id, delta)
+    _reads.forget()
+    if row:
+        recipe_matrix.record_stock([row])
+        return construct(schemas.Ingredient, row)
+    return None
+
+async def bulk_adjust_stock(adjustments: List[Tuple[int, str, float]], atomic: bool = True) -> Tuple[bool, List[dict]]:
+    """
+    Applies a batch of stock changes, e.g. a delivery or a stock count, in one round trip.
+
+    Args:
+        adjustments: (ingredient_id, mode, quantity) triples, applied in order.
+            mode "set" makes `quantity` the new stock level, "add" adds it
+            (negative to take stock). Several entries for the same ingredient
+            are folded together first.
+        atomic: Apply every change or none of them.
+
+    Returns:
+        (applied, results): whether any change was written, and one result
+        per ingredient with its status ("updated", "not_found",
+        "insufficient_stock" or, when an atomic batch was rejected,
+        "not_applied") and stock before and after.
+    """
+    changes = {}
+    for ingredient_id, mode, quantity in adjustments:
+        absolute, value = changes.get(ingredient_id, (False, 0))
+        changes[ingredient_id] = (True, quantity) if mode == "set" else (absolute, value + quantity)
+
+    async with db.transaction() as conn:
+        rows = await stock_reservation.apply_batch(conn, changes, atomic)
+    _reads.forget()
+    recipe_matrix.record_stock(rows)
+
+    results = []
+    for row in rows:
+        if row['previous_stock'] is None:
+            status = "not_found"
+        elif row['requested_stock'] < 0:
+            status = "insufficient_stock"
+        elif row['id'] is None:
+            status = "not_applied"
+        else:
+            status = "updated"
+        results.append({
+            "ingredient_id": row['ingredient_id'],
+            "name": row['ingredient_name'],
+            "status": status,
+            "previous_stock": row['previous_stock'],
+            "current_stock": row['current_stock'] if row['id'] is not None else row['previous_stock'],
+        })
+    return any(result['status'] == "updated" for result in results), results
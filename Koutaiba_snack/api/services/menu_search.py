@@ -0,0 +1,167 @@
+
+import bisect
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Set, Tuple
+
+# How much a match in each field counts towards an item's score.
+FIELD_WEIGHTS = {"name": 3.0, "category": 1.5, "ingredients": 1.2, "description": 1.0}
+
+# Minimum trigram similarity for a typo to still count as a match.
+MIN_SIMILARITY = 0.3
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """Lowercases and strips accents, so "Crème" matches "creme"."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def trigrams(token: str) -> Set[str]:
+    """pg_trgm style trigrams: the token padded with two spaces in front and one behind."""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """
+    In-process fuzzy search over menu items.
+
+    Every item is indexed as a set of (token, field) postings. Query tokens
+    are matched against the vocabulary by exact match, prefix, substring and,
+    for typos, trigram similarity; an item's score is the sum over query
+    tokens of its best weighted match, and every query token must match.
+
+    `update()` diffs the new documents against the indexed ones, so a menu
+    change only re-indexes the items that actually changed.
+    """
+
+    def __init__(self, cache_size: int = 256):
+        self._documents: Dict[int, Tuple[Tuple[str, str], ...]] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._vocabulary: List[str] = []
+        self._cache: "OrderedDict[Tuple[str, int], List[Tuple[int, float]]]" = OrderedDict()
+        self._cache_size = cache_size
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def update(self, documents: Dict[int, Dict[str, str]]) -> int:
+        """
+        Brings the index in line with `documents`.
+
+        Args:
+            documents: Searchable text per item id, keyed by field name
+                (see FIELD_WEIGHTS).
+
+        Returns:
+            The number of items that were added, changed or removed.
+        """
+        changed = 0
+        for item_id in [item_id for item_id in self._documents if item_id not in documents]:
+            self._remove(item_id)
+            changed += 1
+        for item_id, fields in documents.items():
+            document = tuple(sorted((field, text or "") for field, text in fields.items()))
+            if self._documents.get(item_id) == document:
+                continue
+            if item_id in self._documents:
+                self._remove(item_id)
+            self._add(item_id, document)
+            changed += 1
+        if changed:
+            self._cache.clear()
+        return changed
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[int, float]]:
+        """
+        Returns up to `limit` (item_id, score) pairs, best match first.
+        """
+        key = (normalize(query).strip(), limit)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        query_tokens = tokenize(query)
+        scores: Dict[int, float] = {}
+        for position, query_token in enumerate(query_tokens):
+            best: Dict[int, float] = {}
+            for token, similarity in self._match(query_token):
+                for item_id, weight in self._postings[token].items():
+                    score = similarity * weight
+                    if score > best.get(item_id, 0.0):
+                        best[item_id] = score
+            if position == 0:
+                scores = best
+            else:
+                scores = {item_id: score + best[item_id] for item_id, score in scores.items() if item_id in best}
+            if not scores:
+                break
+
+        results = sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))[:limit]
+        self._cache[key] = results
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return results
+
+    def _match(self, query_token: str) -> Iterable[Tuple[str, float]]:
+        """Yields the vocabulary tokens matching `query_token`, with a similarity in (0, 1]."""
+        matched: Dict[str, float] = {}
+        start = bisect.bisect_left(self._vocabulary, query_token)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(query_token):
+                break
+            matched[token] = 1.0 if token == query_token else 0.9
+
+        query_trigrams = trigrams(query_token)
+        candidates: Set[str] = set()
+        for trigram in query_trigrams:
+            candidates |= self._trigrams.get(trigram, set())
+        for token in candidates - matched.keys():
+            if len(query_token) >= 3 and query_token in token:
+                matched[token] = 0.75
+                continue
+            token_trigrams = trigrams(token)
+            similarity = len(query_trigrams & token_trigrams) / len(query_trigrams | token_trigrams)
+            if similarity >= MIN_SIMILARITY:
+                matched[token] = 0.7 * similarity
+        return matched.items()
+
+    def _add(self, item_id: int, document: Tuple[Tuple[str, str], ...]) -> None:
+        self._documents[item_id] = document
+        for field, text in document:
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            for token in tokenize(text):
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    bisect.insort(self._vocabulary, token)
+                    for trigram in trigrams(token):
+                        self._trigrams.setdefault(trigram, set()).add(token)
+                if weight > postings.get(item_id, 0.0):
+                    postings[item_id] = weight
+
+    def _remove(self, item_id: int) -> None:
+        for _, text in self._documents.pop(item_id):
+            for token in tokenize(text):
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(item_id, None)
+                if not postings:
+                    del self._postings[token]
+                    del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+                    for trigram in trigrams(token):
+                        tokens = self._trigrams.get(trigram)
+                        if tokens is not None:
+                            tokens.discard(token)
+                            if not tokens:
+                                del self._trigrams[trigram]
@@ -1,41 +1,213 @@
 
-from api.database.supabase_conn import supabase
+import asyncio
+import bisect
+import os
+from api.database import db
 from api.models import schemas
-from typing import List, Dict
+from api.services import menu_search, recipe_matrix
+from api.utils.cache import SnapshotCache
+from api.utils.fields import Fields, Selection
+from api.utils.pagination import DEFAULT_PAGE_SIZE, decode_cursor, paginate
+from api.utils.responses import PreparedData, prepare_body, prepare_data
+from typing import Any, Callable, List, Dict, Optional, Tuple
+
+ITEM_FIELDS = Fields(("id", "name", "description", "price", "category_id", "available"), relations=("ingredients",))
+
+# Bounds the payloads cached per field selection; each one is cheap to rebuild.
+_MAX_PROJECTIONS = 256
+
+
+class MenuSnapshot:
+    """
+    One consistent, validated view of the menu.
+
+    Items are validated once per snapshot, and the payloads of the hot
+    endpoints are serialized once, so serving them is a dict lookup. The
+    available items also depend on stock, so their payload is reassembled
+    from the per-item payloads only when an item runs out or is restocked.
+    """
+
+    def __init__(self, version: int, item_rows: List[dict], category_rows: List[dict], ingredient_rows: List[dict]):
+        self.version = version
+        self.items = [schemas.Item(**row) for row in item_rows]
+        self.items_by_id = {item.id: item for item in self.items}
+        self.categories = [schemas.Category(**row) for row in category_rows]
+
+        self.menu: Dict[str, List[schemas.Item]] = {}
+        self.items_by_category: Dict[str, List[schemas.Item]] = {}
+        for row, item in zip(item_rows, self.items):
+            self.menu.setdefault(row.get('category_name') or "Uncategorized", []).append(item)
+            if row.get('category_name'):
+                self.items_by_category.setdefault(row['category_name'], []).append(item)
+        self.available = [item for item in self.items if item.available]
+        self.page_order = sorted(self.items, key=lambda item: (item.name, item.id))
+        self.page_keys = [(item.name, item.id) for item in self.page_order]
+        self.category_of = {item.id: row.get('category_name') or "Uncategorized" for row, item in zip(item_rows, self.items)}
+
+        self.payloads: Dict[str, PreparedData] = {
+            "menu": prepare_data(self.menu),
+            "categories": prepare_data(self.categories),
+        }
+        self.item_payloads: Dict[int, PreparedData] = {item.id: prepare_data(item) for item in self.items}
+        # (recipe matrix version, availability version) -> in-stock items and their payload
+        self.in_stock: Tuple[Optional[tuple], List[schemas.Item], Optional[PreparedData]] = (None, [], None)
+
+        self.projections: Dict[tuple, PreparedData] = {}
+
+        ingredient_names: Dict[int, List[str]] = {}
+        self.recipes: Dict[int, List[dict]] = {}
+        for row in ingredient_rows:
+            ingredient_names.setdefault(row['item_id'], []).append(row['name'])
+            self.recipes.setdefault(row['item_id'], []).append(
+                {"name": row['name'], "quantity_required": row['quantity_required'], "unit": row['unit']}
+            )
+        self.search_documents = {
+            row['id']: {
+                "name": row.get('name'),
+                "description": row.get('description'),
+                "category": row.get('category_name'),
+                "ingredients": " ".join(ingredient_names.get(row['id'], [])),
+            }
+            for row in item_rows
+        }
+
+    def available_in_stock(self, matrix: recipe_matrix.RecipeMatrix) -> Tuple[List[schemas.Item], PreparedData]:
+        """The available items whose ingredients are in stock, rebuilt only when an item's stock state flipped."""
+        key = (matrix.version, matrix.availability_version)
+        if self.in_stock[0] != key:
+            items = [item for item in self.available if item.id not in matrix.out_of_stock]
+            body = b"[" + b",".join(self.item_payloads[item.id].body for item in items) + b"]"
+            self.in_stock = (key, items, prepare_body(body))
+        return self.in_stock[1], self.in_stock[2]
+
+    def shape(self, items: List[schemas.Item], selection: Optional[Selection]) -> list:
+        """Trims items to the selected fields and embeds their recipe if asked to."""
+        if selection is None or (selection.columns is None and not selection.include):
+            return items
+        shaped = []
+        for item in items:
+            row = selection.project(item) if selection.columns is not None else item.model_dump()
+            if "ingredients" in selection.include:
+                row["ingredients"] = self.recipes.get(item.id, [])
+            shaped.append(row)
+        return shaped
+
+    def prepared(self, key: tuple, build: Callable[[], Any]) -> PreparedData:
+        """Serializes `build()` once per key, for the payloads of field selections."""
+        payload = self.projections.get(key)
+        if payload is None:
+            if len(self.projections) >= _MAX_PROJECTIONS:
+                self.projections.clear()
+            payload = self.projections[key] = prepare_data(build())
+        return payload
+
+
+async def _load_snapshot(version: int) -> MenuSnapshot:
+    item_rows, category_rows, ingredient_rows = await asyncio.gather(
+        db.fetch(
+            "SELECT i.*, c.name AS category_name FROM items i "
+            "LEFT JOIN categories c ON c.id = i.category_id ORDER BY i.name, i.id"
+        ),
+        db.fetch("SELECT * FROM categories ORDER BY name"),
+        db.fetch(
+            "SELECT ii.item_id, g.name, ii.quantity_required, g.unit FROM item_ingredients ii "
+            "JOIN ingredients g ON g.id = ii.ingredient_id ORDER BY g.name"
+        ),
+    )
+    return MenuSnapshot(version, item_rows, category_rows, ingredient_rows)
+
+
+# Shared across snapshots, so a menu edit only re-indexes the items it changed.
+_search_index = menu_search.SearchIndex()
+# Version of the snapshot the index was last brought in line with.
+_indexed_version = 0
+_cache = SnapshotCache(_load_snapshot, ttl=float(os.environ.get("MENU_CACHE_TTL", 300)), name="menu")
+
+def _search_index_for(snapshot: MenuSnapshot) -> menu_search.SearchIndex:
+    """
+    The search index, first brought in line with `snapshot` if it was built
+    from another one. Indexing at search time rather than on load means a
+    load the cache discards (one that raced an invalidation) never leaves
+    its documents behind.
+    """
+    global _indexed_version
+    if _indexed_version != snapshot.version:
+        _search_index.update(snapshot.search_documents)
+        _indexed_version = snapshot.version
+    return _search_index
+
+async def get_snapshot() -> MenuSnapshot:
+    return await _cache.get()
+
+async def warm() -> None:
+    """Loads the menu and indexes it for search."""
+    _search_index_for(await _cache.get())
+
+def invalidate_cache(payload: str = None) -> None:
+    """Drops the menu snapshot; the next read rebuilds it. Used as the `menu_changed` NOTIFY callback."""
+    _cache.invalidate()
+
+async def get_payload(view: str, selection: Selection = None) -> PreparedData:
+    """The prepared payload of a view; `selection` trims the items of the "menu" and "available" views."""
+    snapshot = await _cache.get()
+    if selection is not None and selection == ITEM_FIELDS.all:
+        selection = None
+    if view == "available":
+        matrix = await recipe_matrix.get_matrix()
+        items, payload = snapshot.available_in_stock(matrix)
+        if selection is None:
+            return payload
+        key = (view, selection, matrix.version, matrix.availability_version)
+        return snapshot.prepared(key, lambda: snapshot.shape(items, selection))
+    if view == "menu" and selection is not None:
+        return snapshot.prepared((view, selection), lambda: {
+            category: snapshot.shape(items, selection) for category, items in snapshot.menu.items()
+        })
+    return snapshot.payloads[view]
+
+async def get_item_payload(item_id: int, selection: Selection = None) -> Optional[PreparedData]:
+    snapshot = await _cache.get()
+    if selection is None or selection == ITEM_FIELDS.all:
+        return snapshot.item_payloads.get(item_id)
+    item = snapshot.items_by_id.get(item_id)
+    if item is None:
+        return None
+    return snapshot.prepared(("item", item_id, selection), lambda: snapshot.shape([item], selection)[0])
 
 async def get_full_menu() -> Dict[str, List[schemas.Item]]:
-    response = supabase.from_("items").select("*, categories(name)").order("name").execute()
+    return (await _cache.get()).menu
+
+async def get_menu_page(limit: int = DEFAULT_PAGE_SIZE, cursor: str = None, selection: Selection = None) -> Tuple[Dict[str, List[schemas.Item]], Optional[str]]:
+    """Returns the menu a page of items at a time, in (name, id) order, grouped by category."""
+    snapshot = await _cache.get()
+    start = 0
+    if cursor:
+        name, item_id = decode_cursor(cursor, 2)
+        if not isinstance(name, str) or not isinstance(item_id, int):
+            raise ValueError("Invalid cursor")
+        start = bisect.bisect_right(snapshot.page_keys, (name, item_id))
+    items, next_cursor = paginate(snapshot.page_order[start:start + limit + 1], limit, lambda item: [item.name, item.id])
     menu = {}
-    for item in response.data:
-        category_name = "Uncategorized"
-        if item.get('categories') and item['categories'].get('name'):
-            category_name = item['categories']['name']
-        
-        if category_name not in menu:
-            menu[category_name] = []
-        menu[category_name].append(schemas.Item(**item))
-    return menu
+    for item in items:
+        menu.setdefault(snapshot.category_of[item.id], []).append(item)
+    return {category: snapshot.shape(items, selection) for category, items in menu.items()}, next_cursor
 
 async def get_all_categories() -> List[schemas.Category]:
-    response = supabase.from_("categories").select("*").order("name").execute()
-    return [schemas.Category(**row) for row in response.data]
+    return (await _cache.get()).categories
 
-async def get_items_by_category_name(category_name: str) -> List[schemas.Item]:
-    response = supabase.from_("categories").select("items(*)").eq("name", category_name).order("name").execute()
-    if not response.data:
-        return []
-    return [schemas.Item(**item) for item in response.data[0]['items']]
+async def get_items_by_category_name(category_name: str, selection: Selection = None) -> List[schemas.Item]:
+    snapshot = await _cache.get()
+    return snapshot.shape(snapshot.items_by_category.get(category_name, []), selection)
 
 async def get_item_by_id(item_id: int) -> schemas.Item:
-    response = supabase.from_("items").select("*").eq("id", item_id).execute()
-    if response.data:
-        return schemas.Item(**response.data[0])
-    return None
+    return (await _cache.get()).items_by_id.get(item_id)
 
-async def search_menu_items(query: str) -> List[schemas.Item]:
-    response = supabase.from_("items").select("*").ilike("name", f"%{query}%").order("name").execute()
-    return [schemas.Item(**row) for row in response.data]
+async def search_menu_items(query: str, limit: int = 20, selection: Selection = None) -> List[schemas.Item]:
+    snapshot = await _cache.get()
+    items = [snapshot.items_by_id[item_id] for item_id, _ in _search_index_for(snapshot).search(query, limit) if item_id in snapshot.items_by_id]
+    return snapshot.shape(items, selection)
 
 async def get_available_items() -> List[schemas.Item]:
-    response = supabase.from_("items").select("*").eq("available", True).order("name").execute()
-    return [schemas.Item(**row) for row in response.data]
+    """Items flagged available whose ingredients are currently in stock."""
+    snapshot = await _cache.get()
+    return snapshot.available_in_stock(await recipe_matrix.get_matrix())[0]
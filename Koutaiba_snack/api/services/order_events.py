@@ -0,0 +1,117 @@
+
+import json
+import os
+from api.database import db
+from api.utils.events import Event, EventHub
+from api.utils.log import get_logger
+from api.utils.serialization import dumps
+from typing import Iterable, List, Optional
+
+CHANNEL = "order_events"
+
+# How many missed events a reconnecting client can catch up on; further
+# behind, it is told to reload its orders instead.
+REPLAY_LIMIT = int(os.environ.get("ORDER_EVENTS_REPLAY_LIMIT", 1000))
+RETENTION_HOURS = float(os.environ.get("ORDER_EVENTS_RETENTION_HOURS", 48))
+
+logger = get_logger(__name__)
+
+hub = EventHub("orders", history=REPLAY_LIMIT)
+
+
+def _payload(order: dict, previous_status: Optional[str] = None) -> dict:
+    return {
+        "order_id": order['id'],
+        "status": order.get('status'),
+        "previous_status": previous_status,
+        "customer_name": order.get('customer_name'),
+        "table_number": order.get('table_number'),
+        "total_amount": order.get('total_amount'),
+        "created_at": order.get('created_at'),
+        "updated_at": order.get('updated_at'),
+    }
+
+
+# Taken before an event is numbered and held until its transaction commits,
+# so events are numbered in commit order, the order NOTIFY delivers them in.
+# A client resuming after event N has then seen every event below N, and the
+# event table can replay `seq > N`. Only the tail of order-writing
+# transactions (event insert to commit) is serialized.
+_ORDERED = f"l AS (SELECT pg_advisory_xact_lock(hashtext('{CHANNEL}')))"
+
+
+async def record(conn: db.Connection, event: str, order: dict, previous_status: Optional[str] = None) -> int:
+    """
+    Appends an order lifecycle event and queues its notification, in one round trip.
+
+    Run it on the transaction that changes the order, so the event is only
+    published if that change commits, and as its last step: it holds the
+    ordering lock (see _ORDERED) until that commit. Returns the event's
+    sequence number.
+    """
+    row = await conn.fetchrow(
+        f"WITH {_ORDERED}, e AS (INSERT INTO order_events (event, order_id, payload) SELECT $1, $2, $3::jsonb FROM l "
+        "RETURNING seq, event, payload) "
+        "SELECT e.seq, pg_notify($4, json_build_object('seq', e.seq, 'event', e.event, 'data', e.payload)::text) FROM e",
+        event, order['id'], dumps(_payload(order, previous_status)).decode("utf-8"), CHANNEL,
+    )
+    return row['seq']
+
+
+async def record_many(conn: db.Connection, event: str, orders: List[dict]) -> None:
+    """Like `record` for a batch of orders, in one round trip; events are numbered in list order."""
+    if not orders:
+        return
+    await conn.execute(
+        f"WITH {_ORDERED}, e AS (INSERT INTO order_events (event, order_id, payload) "
+        "SELECT $1, (p.payload::jsonb->>'order_id')::int, p.payload::jsonb "
+        "FROM l, unnest($2::text[]) WITH ORDINALITY AS p (payload, position) ORDER BY p.position "
+        "RETURNING seq, event, payload) "
+        "SELECT pg_notify($3, json_build_object('seq', e.seq, 'event', e.event, 'data', e.payload)::text) FROM e ORDER BY e.seq",
+        event, [dumps(_payload(order)).decode("utf-8") for order in orders], CHANNEL,
+    )
+
+
+def on_notification(payload: str) -> None:
+    """`order_events` NOTIFY callback: fans the event out to this worker's subscribers."""
+    try:
+        message = json.loads(payload)
+        hub.publish(message['event'], message['data'], message['seq'])
+    except (ValueError, KeyError) as e:
+        logger.warning("malformed order event", extra={"error": str(e), "payload": payload[:200]})
+
+
+async def replay(last_id: int) -> Optional[List[Event]]:
+    """
+    Returns the events after `last_id`, or None if the client is more than
+    REPLAY_LIMIT events behind and should reload instead.
+
+    Recent events come from memory in delivery order; older ones from the
+    event table, whose `seq` follows the same order.
+    """
+    events = hub.replay(last_id)
+    if events is not None:
+        return events
+    rows = await db.fetch(
+        "SELECT seq, event, payload::text AS payload FROM order_events WHERE seq > $1 ORDER BY seq LIMIT $2",
+        last_id, REPLAY_LIMIT + 1,
+    )
+    if len(rows) > REPLAY_LIMIT:
+        return None
+    return [Event(row['seq'], row['event'], json.loads(row['payload'])) for row in rows]
+
+
+async def latest_seq() -> int:
+    return await db.fetchval("SELECT COALESCE(MAX(seq), 0) FROM order_events")
+
+
+async def prune() -> str:
+    return await db.execute(
+        "DELETE FROM order_events WHERE created_at < now() - make_interval(secs => $1)",
+        RETENTION_HOURS * 3600,
+    )
+
+
+def matches(statuses: Iterable[str], data: dict) -> bool:
+    """Whether an event concerns an order entering or leaving one of `statuses`."""
+    return data.get('status') in statuses or data.get('previous_status') in statuses
@@ -0,0 +1,315 @@
+import asyncio
+import json
+import os
+import time
+from api.database import db
+from api.models import schemas
+from api.services import order_events, order_service, popularity, recipe_matrix, revenue_counters, stock_reservation
+from api.utils import metrics
+from api.utils.events import EventHub
+from api.utils.log import get_logger
+from api.utils.serialization import dumps
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException
+
+# Completion of an intake entry, {"id", "status", "order_id", "error"}.
+CHANNEL = "order_intake"
+# Wakes idle workers on every API worker when an order is queued.
+QUEUED_CHANNEL = "order_intake_queued"
+
+WORKERS = int(os.environ.get("ORDER_INTAKE_WORKERS", 2))
+BATCH_SIZE = int(os.environ.get("ORDER_INTAKE_BATCH_SIZE", 50))
+# Idle workers also look for work this often, in case a notification was missed.
+POLL_SECONDS = float(os.environ.get("ORDER_INTAKE_POLL_SECONDS", 1))
+RETENTION_HOURS = float(os.environ.get("ORDER_INTAKE_RETENTION_HOURS", 48))
+# How long shutdown waits for the batches in progress before cancelling them.
+STOP_TIMEOUT = 10
+
+logger = get_logger(__name__)
+
+hub = EventHub("order_intake")
+
+processed = metrics.registry.counter("order_intake_total", "Asynchronously placed orders by outcome.", ("outcome",))
+queue_wait = metrics.registry.histogram(
+    "order_intake_wait_seconds",
+    "Time from accepting an asynchronous order to creating or rejecting it.",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+batch_sizes = metrics.registry.histogram(
+    "order_intake_batch_size", "Orders per fulfilment batch.", buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+
+_wake = asyncio.Event()
+_workers: List[asyncio.Task] = []
+_stopping = False
+
+
+async def enqueue(order_data: schemas.OrderCreate) -> dict:
+    """
+    Validates an order against the in-memory recipe matrix and queues it.
+
+    Only the cart itself is checked here; stock is reserved by the worker
+    that creates the order. Raises a 400 HTTPException for an empty cart or
+    an item without a recipe, like `order_service.create_order`.
+
+    Returns:
+        The intake entry: {"id", "status", "created_at"}.
+    """
+    if not order_data.items:
+        raise HTTPException(status_code=400, detail="Order must contain at least one item.")
+    matrix = await recipe_matrix.get_matrix()
+    for item in order_data.items:
+        index = matrix.item_index.get(item.item_id)
+        if index is None or not matrix.has_recipe[index]:
+            raise HTTPException(status_code=400, detail=f"Item with ID {item.item_id} has no ingredients.")
+    row = await db.fetchrow(
+        "WITH q AS (INSERT INTO order_intake (payload) VALUES ($1::jsonb) RETURNING id, status, created_at) "
+        "SELECT q.id, q.status, q.created_at, pg_notify($2, q.id::text) FROM q",
+        dumps(order_data).decode("utf-8"), QUEUED_CHANNEL,
+    )
+    processed.inc("queued")
+    return {"id": row['id'], "status": row['status'], "created_at": row['created_at']}
+
+
+async def get(intake_id: int) -> Optional[dict]:
+    return await db.fetchrow(
+        "SELECT id, status, order_id, error, created_at, finished_at FROM order_intake WHERE id = $1",
+        intake_id,
+    )
+
+
+async def wait_for(intake_id: int, timeout: float) -> Optional[dict]:
+    """
+    Returns the intake entry once it is no longer queued, or as it is after
+    `timeout` seconds. None if there is no such entry.
+    """
+    # Subscribe before reading, so a completion in between is not missed.
+    with hub.subscribe() as queue:
+        entry = await get(intake_id)
+        if entry is None or entry['status'] != "queued" or timeout <= 0:
+            return entry
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if event.data.get('id') == intake_id:
+                break
+    # Read it back rather than trusting the event: the subscriber queue may have dropped it.
+    return await get(intake_id)
+
+
+def on_queued(payload: str) -> None:
+    """`order_intake_queued` NOTIFY callback: wakes this worker's idle fulfilment workers."""
+    _wake.set()
+
+
+def on_notification(payload: str) -> None:
+    """`order_intake` NOTIFY callback: tells this worker's waiting clients an entry finished."""
+    try:
+        message = json.loads(payload)
+        hub.publish(message['status'], message)
+    except (ValueError, KeyError) as e:
+        logger.warning("malformed order intake event", extra={"error": str(e), "payload": payload[:200]})
+
+
+async def _fulfil(conn: db.Connection, entries: List[dict]) -> Tuple[List[tuple], list, list]:
+    """
+    Creates the orders of a batch of claimed entries on the claiming transaction.
+
+    Orders are admitted first come, first served against the locked stock
+    of every ingredient the batch uses; an order the remaining stock can't
+    cover is rejected without holding up the others. The accepted orders
+    then cost one insert for the orders, one for their lines and one
+    coalesced decrement per ingredient, however many orders share it.
+
+    Returns:
+        (outcomes, created orders with their lines, updated ingredient rows),
+        outcomes being (entry id, status, order id, error) per entry.
+    """
+    carts = [schemas.OrderCreate(**json.loads(entry['payload'])) for entry in entries]
+    item_ids = sorted({item.item_id for cart in carts for item in cart.items})
+    prices, recipes = await order_service.fetch_cart(conn, item_ids)
+
+    demands: List[Optional[Dict[int, float]]] = []
+    outcomes: Dict[int, tuple] = {}
+    for entry, cart in zip(entries, carts):
+        try:
+            demands.append(order_service.cart_demand(cart, recipes))
+        except HTTPException as e:
+            demands.append(None)
+            outcomes[entry['id']] = (entry['id'], "rejected", None, e.detail)
+
+    ingredient_ids = sorted({ingredient_id for demand in demands if demand for ingredient_id in demand})
+    stock = {
+        row['id']: row
+        for row in await conn.fetch(
+            "SELECT id, name, current_stock FROM ingredients WHERE id = ANY($1::int[]) ORDER BY id FOR UPDATE",
+            ingredient_ids,
+        )
+    }
+    remaining = {ingredient_id: row['current_stock'] for ingredient_id, row in stock.items()}
+    accepted, combined = [], {}
+    for entry, cart, demand in zip(entries, carts, demands):
+        if demand is None:
+            continue
+        short = [ingredient_id for ingredient_id, quantity in demand.items() if remaining.get(ingredient_id, 0) < quantity]
+        if short:
+            shortfalls = [stock.get(ingredient_id) or {"name": f"ingredient {ingredient_id}"} for ingredient_id in sorted(short)]
+            outcomes[entry['id']] = (entry['id'], "rejected", None, str(stock_reservation.InsufficientStockError(shortfalls)))
+            continue
+        for ingredient_id, quantity in demand.items():
+            remaining[ingredient_id] -= quantity
+            combined[ingredient_id] = combined.get(ingredient_id, 0) + quantity
+        accepted.append((entry, cart))
+
+    created, stock_rows = [], []
+    if accepted:
+        # Ids are drawn up front, so each order row is known to belong to its entry.
+        order_ids = [
+            row['id'] for row in await conn.fetch(
+                "SELECT nextval(pg_get_serial_sequence('orders', 'id'))::int AS id FROM generate_series(1, $1)",
+                len(accepted),
+            )
+        ]
+        orders, args = db.values_rows([
+            (order_id, cart.customer_name, cart.customer_phone, cart.table_number, cart.notes,
+             sum(prices[item.item_id] * item.quantity for item in cart.items))
+            for order_id, (_, cart) in zip(order_ids, accepted)
+        ])
+        rows = {
+            row['id']: row
+            for row in await conn.fetch(
+                f"INSERT INTO orders (id, customer_name, customer_phone, table_number, notes, total_amount) VALUES {orders} RETURNING *",
+                *args,
+            )
+        }
+        lines, args = db.values_rows([
+            (order_id, item.item_id, item.quantity, prices[item.item_id], item.notes)
+            for order_id, (_, cart) in zip(order_ids, accepted)
+            for item in cart.items
+        ])
+        await conn.execute(f"INSERT INTO order_items (order_id, item_id, quantity, unit_price, notes) VALUES {lines}", *args)
+        # Already checked under the locks above, so this cannot fall short.
+        stock_rows = await stock_reservation.reserve(conn, combined)
+        created = [(rows[order_id], cart) for order_id, (_, cart) in zip(order_ids, accepted)]
+        await order_events.record_many(conn, "order_created", [order for order, _ in created])
+        for order_id, (entry, _) in zip(order_ids, accepted):
+            outcomes[entry['id']] = (entry['id'], "created", order_id, None)
+
+    return [outcomes[entry['id']] for entry in entries], created, stock_rows
+
+
+async def _finish(conn: db.Connection, outcomes: List[tuple]) -> None:
+    """Records the outcome of every entry and notifies the clients waiting on them."""
+    values, args = db.values_rows(outcomes, casts=("bigint", "text", "int", "text"), start=2)
+    await conn.execute(
+        "WITH u AS (UPDATE order_intake SET status = o.column2, order_id = o.column3, error = o.column4, finished_at = now() "
+        f"FROM (VALUES {values}) AS o WHERE order_intake.id = o.column1 "
+        "RETURNING order_intake.id, order_intake.status, order_intake.order_id, order_intake.error) "
+        "SELECT pg_notify($1, json_build_object('id', u.id, 'status', u.status, 'order_id', u.order_id, 'error', u.error)::text) FROM u",
+        CHANNEL, *args,
+    )
+
+
+async def process_batch(limit: int = BATCH_SIZE) -> int:
+    """
+    Claims up to `limit` queued entries, oldest first, and creates their
+    orders in one transaction. Returns how many entries were processed.
+
+    Entries stay locked until the transaction ends, so workers on every API
+    worker can run side by side without taking the same ones, and a crash
+    leaves them queued, as does a deadlock. If the batch fails otherwise it
+    is retried one entry at a time, and an entry that fails on its own is
+    marked `failed` instead of blocking the queue.
+    """
+    async with db.transaction() as conn:
+        entries = await conn.fetch(
+            "SELECT id, payload::text AS payload, created_at FROM order_intake WHERE status = 'queued' "
+            "ORDER BY id LIMIT $1 FOR UPDATE SKIP LOCKED",
+            limit,
+        )
+        if not entries:
+            return 0
+        try:
+            async with conn.savepoint():
+                outcomes, created, stock_rows = await _fulfil(conn, entries)
+        except db.TransientError:
+            # Rolls the claim back too; the entries are picked up again.
+            raise
+        except Exception as e:
+            logger.warning("order intake batch failed, retrying one by one", extra={"entries": len(entries), "error": str(e)})
+            outcomes, created, stock_rows = [], [], []
+            for entry in entries:
+                try:
+                    async with conn.savepoint():
+                        outcome, orders, rows = await _fulfil(conn, [entry])
+                except db.TransientError:
+                    raise
+                except Exception:
+                    logger.exception("order intake entry failed", extra={"intake_id": entry['id']})
+                    outcome, orders, rows = [(entry['id'], "failed", None, "Could not create order.")], [], []
+                outcomes += outcome
+                created += orders
+                stock_rows += rows
+        await _finish(conn, outcomes)
+
+    now = time.time()
+    batch_sizes.observe(value=len(entries))
+    for entry, (_, status, _, _) in zip(entries, outcomes):
+        processed.inc(status)
+        queue_wait.observe(value=max(0.0, now - entry['created_at'].timestamp()))
+    for order, cart in created:
+        revenue_counters.record_order(order)
+        popularity.record_order(order, [(item.item_id, item.quantity) for item in cart.items])
+    recipe_matrix.record_stock(stock_rows)
+    logger.info("order intake batch", extra={"entries": len(entries), "orders": len(created)})
+    return len(entries)
+
+
+async def _work() -> None:
+    while not _stopping:
+        # Cleared before looking, so an order queued meanwhile still wakes us.
+        _wake.clear()
+        try:
+            count = await process_batch()
+        except Exception as e:
+            logger.warning("order intake worker error", extra={"error": str(e)})
+            count = 0
+        if count == 0 and not _stopping:
+            try:
+                await asyncio.wait_for(_wake.wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+def start(count: int = WORKERS) -> None:
+    """Starts `count` fulfilment workers on this API worker (none if 0)."""
+    global _stopping
+    _stopping = False
+    for _ in range(count - len(_workers)):
+        _workers.append(asyncio.create_task(_work()))
+
+
+async def stop() -> None:
+    """Lets the workers finish their current batch, then stops them."""
+    global _stopping
+    _stopping = True
+    _wake.set()
+    if _workers:
+        _, pending = await asyncio.wait(_workers, timeout=STOP_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    _workers.clear()
+
+
+async def prune() -> str:
+    return await db.execute(
+        "DELETE FROM order_intake WHERE status <> 'queued' AND finished_at < now() - make_interval(secs => $1)",
+        RETENTION_HOURS * 3600,
+    )
@@ -1,117 +1,215 @@
 
-from api.database.supabase_conn import supabase
+from datetime import datetime
+from api.database import db
 from api.models import schemas
-from typing import List
+from api.services import order_events, popularity, recipe_matrix, revenue_counters, stock_reservation
+from api.utils.fields import Fields, Selection
+from api.utils.log import get_logger
+from api.utils.normalize import normalize_name, normalize_phone, prefix_range
+from api.utils.pagination import DEFAULT_PAGE_SIZE, decode_cursor, paginate
+from api.utils.serialization import construct
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from fastapi import HTTPException
 
-async def create_order(order_data: schemas.OrderCreate) -> schemas.Order:
-    # 1. Check stock for all items in the order
-    print("Checking stock...")
+logger = get_logger(__name__)
+
+# Statuses an order doesn't leave; the rest are still open for the kitchen and front of house.
+FINAL_STATUSES = ("completed", "cancelled", "canceled")
+
+ORDER_FIELDS = Fields(
+    ("id", "customer_name", "customer_phone", "table_number", "notes", "status", "total_amount", "created_at", "updated_at"),
+    relations=("items",),
+)
+
+async def fetch_cart(conn: db.Connection, item_ids: List[int]) -> Tuple[Dict[int, Any], Dict[int, List[dict]]]:
+    """Fetches the price and recipe rows of every item in a cart (or several) in one query."""
+    rows = await conn.fetch(
+        "SELECT i.id AS item_id, i.price, ii.ingredient_id, ii.quantity_required "
+        "FROM items i LEFT JOIN item_ingredients ii ON ii.item_id = i.id "
+        f"WHERE i.id IN ({db.placeholders(len(item_ids))})",
+        *item_ids,
+    )
+    prices, recipes = {}, {}
+    for row in rows:
+        prices[row['item_id']] = row['price']
+        recipe = recipes.setdefault(row['item_id'], [])
+        if row['ingredient_id'] is not None:
+            recipe.append(row)
+    return prices, recipes
+
+def cart_demand(order_data: schemas.OrderCreate, recipes: Dict[int, List[dict]]) -> Dict[int, Any]:
+    """The combined ingredient demand of a whole cart; raises a 400 HTTPException for an item without a recipe."""
+    demand = {}
     for item in order_data.items:
-        response = supabase.from_("item_ingredients").select("quantity_required, ingredients(name, current_stock)").eq("item_id", item.item_id).execute()
-        print(f"Stock check response for item {item.item_id}: {response}")
-        if not response.data:
+        if not recipes.get(item.item_id):
             raise HTTPException(status_code=400, detail=f"Item with ID {item.item_id} has no ingredients.")
+        for row in recipes[item.item_id]:
+            demand[row['ingredient_id']] = demand.get(row['ingredient_id'], 0) + row['quantity_required'] * item.quantity
+    return demand
 
-        for row in response.data:
-            if row['ingredients']['current_stock'] < row['quantity_required'] * item.quantity:
-                raise HTTPException(status_code=400, detail=f"Not enough stock for item: {row['ingredients']['name']}")
-
-    # 2. Create the order and get the order ID
-    print("Creating order...")
-    order_response = supabase.from_("orders").insert({
-        "customer_name": order_data.customer_name,
-        "customer_phone": order_data.customer_phone,
-        "table_number": order_data.table_number,
-        "notes": order_data.notes
-    }).execute()
-    print(f"Create order response: {order_response}")
-
-    if not order_response.data:
-        raise HTTPException(status_code=500, detail="Could not create order.")
-
-    order_id = order_response.data[0]['id']
-
-    # 3. Insert order items and update stock
-    print("Inserting order items and updating stock...")
-    total_amount = 0
-    for item in order_data.items:
-        # Get item price
-        item_price_response = supabase.from_("items").select("price").eq("id", item.item_id).execute()
-        print(f"Item price response for item {item.item_id}: {item_price_response}")
-        unit_price = item_price_response.data[0]['price']
-        total_amount += unit_price * item.quantity
-
-        # Insert order item
-        order_item_response = supabase.from_("order_items").insert({
-            "order_id": order_id,
-            "item_id": item.item_id,
-            "quantity": item.quantity,
-            "unit_price": unit_price,
-            "notes": item.notes
-        }).execute()
-        print(f"Insert order item response for item {item.item_id}: {order_item_response}")
-
-        # Update ingredient stock
-        item_ingredients_response = supabase.from_("item_ingredients").select("ingredient_id, quantity_required").eq("item_id", item.item_id).execute()
-        print(f"Item ingredients response for item {item.item_id}: {item_ingredients_response}")
-        for ingredient in item_ingredients_response.data:
-            ingredient_id = ingredient['ingredient_id']
-            quantity_required = ingredient['quantity_required']
-
-            # Get current stock
-            ingredient_stock_response = supabase.from_("ingredients").select("current_stock").eq("id", ingredient_id).execute()
-            print(f"Ingredient stock response for ingredient {ingredient_id}: {ingredient_stock_response}")
-            current_stock = ingredient_stock_response.data[0]['current_stock']
-
-            # Update stock
-            update_stock_response = supabase.from_("ingredients").update({"current_stock": current_stock - (quantity_required * item.quantity)}).eq("id", ingredient_id).execute()
-            print(f"Update stock response for ingredient {ingredient_id}: {update_stock_response}")
-
-    # 4. Update the total amount for the order
-    print("Updating total amount...")
-    update_total_response = supabase.from_("orders").update({"total_amount": total_amount}).eq("id", order_id).execute()
-    print(f"Update total amount response: {update_total_response}")
-
-    # 5. Fetch and return the created order
-    print("Fetching created order...")
-    created_order_response = supabase.from_("orders").select("*").eq("id", order_id).execute()
-    print(f"Created order response: {created_order_response}")
-    return schemas.Order(**created_order_response.data[0])
-
-async def get_all_orders(status: str = None) -> List[schemas.Order]:
-    print("Getting all orders...")
-    query = supabase.from_("orders").select("*").order("created_at", desc=True)
+async def create_order(order_data: schemas.OrderCreate) -> schemas.Order:
+    if not order_data.items:
+        raise HTTPException(status_code=400, detail="Order must contain at least one item.")
+    item_ids = sorted({item.item_id for item in order_data.items})
+
+    async with db.transaction() as conn:
+        # 1. Fetch prices and recipes for every item in the cart at once
+        prices, recipes = await fetch_cart(conn, item_ids)
+
+        # 2. Work out the combined ingredient demand of the whole cart
+        demand = cart_demand(order_data, recipes)
+
+        # 3. Create the order with its total already computed
+        total_amount = sum(prices[item.item_id] * item.quantity for item in order_data.items)
+        created_order = await conn.fetchrow(
+            "INSERT INTO orders (customer_name, customer_phone, table_number, notes, total_amount) "
+            "VALUES ($1, $2, $3, $4, $5) RETURNING *",
+            order_data.customer_name, order_data.customer_phone, order_data.table_number, order_data.notes, total_amount,
+        )
+        if not created_order:
+            raise HTTPException(status_code=500, detail="Could not create order.")
+        order_id = created_order['id']
+
+        # 4. Insert all order lines in one statement
+        lines, args = db.values_rows(
+            [(order_id, item.item_id, item.quantity, prices[item.item_id], item.notes) for item in order_data.items]
+        )
+        await conn.execute(
+            f"INSERT INTO order_items (order_id, item_id, quantity, unit_price, notes) VALUES {lines}",
+            *args,
+        )
+
+        # 5. Reserve the stock for the whole order, or reject it and roll everything back
+        try:
+            stock_rows = await stock_reservation.reserve(conn, demand)
+        except stock_reservation.InsufficientStockError as e:
+            logger.info("order rejected", extra={"order_id": order_id, "shortfalls": len(e.shortfalls)})
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # 6. Announce the order to the kitchen displays once it commits
+        await order_events.record(conn, "order_created", created_order)
+
+    logger.info("order created", extra={"order_id": order_id, "lines": len(order_data.items), "ingredients": len(demand)})
+
+    revenue_counters.record_order(created_order)
+    recipe_matrix.record_stock(stock_rows)
+    popularity.record_order(created_order, [(item.item_id, item.quantity) for item in order_data.items])
+    return construct(schemas.Order, created_order)
+
+async def _list_orders(condition: str, args: list, limit: int = None, cursor: str = None, selection: Selection = None) -> Tuple[list, Optional[str]]:
+    """Runs `SELECT ... FROM orders WHERE condition`, newest first, one keyset page at a time."""
+    selection = selection or ORDER_FIELDS.all
+    args = list(args)
+    if cursor:
+        limit = limit or DEFAULT_PAGE_SIZE
+        created_at, order_id = decode_cursor(cursor, 2)
+        try:
+            args += [datetime.fromisoformat(created_at), int(order_id)]
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+        condition += f" AND (created_at, id) < (${len(args) - 1}::timestamptz, ${len(args)}::int)"
+    query = f"SELECT {selection.sql('created_at', 'id')} FROM orders WHERE {condition} ORDER BY created_at DESC, id DESC"
+    if limit:
+        args.append(limit + 1)
+        query += f" LIMIT ${len(args)}"
+    rows = await db.fetch(query, *args)
+    rows, next_cursor = paginate(rows, limit, lambda row: [row['created_at'].isoformat(), row['id']])
+    if "items" in selection.include and rows:
+        await _attach_items(rows)
+    if selection.columns is None:
+        return [construct(schemas.Order, row) for row in rows], next_cursor
+    return [selection.project(row) for row in rows], next_cursor
+
+async def _attach_items(rows: List[dict]) -> None:
+    """Embeds the order items of a page of orders, fetched in one query."""
+    items = {row['id']: [] for row in rows}
+    for item in await db.fetch("SELECT * FROM order_items WHERE order_id = ANY($1::int[]) ORDER BY id", list(items)):
+        items[item['order_id']].append(construct(schemas.OrderItem, item))
+    for row in rows:
+        row['items'] = items[row['id']]
+
+async def get_all_orders(status: str = None, limit: int = None, cursor: str = None, selection: Selection = None) -> Tuple[List[schemas.Order], Optional[str]]:
     if status:
-        query = query.eq("status", status)
-    response = query.execute()
-    print(f"Get all orders response: {response}")
-    return [schemas.Order(**row) for row in response.data]
-
-async def get_order_by_id(order_id: int) -> schemas.Order:
-    order_response = supabase.from_("orders").select("*, order_items(*)").eq("id", order_id).single().execute()
-    if not order_response.data:
-        return None
-
-    order_data = order_response.data
-    order_items_raw = order_data.pop('order_items', [])
-
-    order_items_parsed = [schemas.OrderItem(**item) for item in order_items_raw]
-
-    order_data['items'] = order_items_parsed
-    return schemas.Order(**order_data)
-
-async def get_orders_by_status(status: str) -> List[schemas.Order]:
-    response = supabase.from_("orders").select("*").eq("status", status).order("created_at", desc=True).execute()
-    return [schemas.Order(**row) for row in response.data]
-
-async def get_orders_by_customer(customer_name: str) -> List[schemas.Order]:
-    response = supabase.from_("orders").select("*").ilike("customer_name", f"%{customer_name}%").order("created_at", desc=True).execute()
-    return [schemas.Order(**row) for row in response.data]
+        orders, next_cursor = await _list_orders("status = $1", [status], limit, cursor, selection)
+    else:
+        orders, next_cursor = await _list_orders("TRUE", [], limit, cursor, selection)
+    logger.debug("listed orders", extra={"status": status, "count": len(orders)})
+    return orders, next_cursor
+
+async def get_order_by_id(order_id: int, selection: Selection = None) -> schemas.Order:
+    """Returns the order with its items embedded, unless `selection` says otherwise."""
+    selection = selection or ORDER_FIELDS.select(default_include=("items",))
+    async with db.connection() as conn:
+        order_data = await conn.fetchrow(f"SELECT {selection.sql()} FROM orders WHERE id = $1", order_id)
+        if not order_data:
+            return None
+        if "items" in selection.include:
+            order_items_raw = await conn.fetch("SELECT * FROM order_items WHERE order_id = $1", order_id)
+            order_data['items'] = [construct(schemas.OrderItem, item) for item in order_items_raw]
+
+    if selection.columns is None:
+        return construct(schemas.Order, order_data)
+    return selection.project(order_data)
+
+async def get_orders_by_status(status: str, limit: int = None, cursor: str = None, selection: Selection = None) -> Tuple[List[schemas.Order], Optional[str]]:
+    return await _list_orders("status = $1", [status], limit, cursor, selection)
+
+async def get_recent_orders(statuses: Iterable[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[schemas.Order], bool]:
+    """
+    The newest `limit` orders in `statuses`, or in any status but
+    FINAL_STATUSES, and whether there were more.
+
+    Each status is an index range scan of `limit` rows
+    (005_keyset_indexes.sql); open orders are read from orders_open_idx
+    (013_open_orders_index.sql).
+    """
+    if statuses:
+        orders = []
+        for status in sorted(statuses):
+            orders += (await _list_orders("status = $1", [status], limit + 1))[0]
+        orders.sort(key=lambda order: (order.created_at, order.id), reverse=True)
+    else:
+        # Literal, so the planner can match the partial index.
+        final = ", ".join(f"'{status}'" for status in FINAL_STATUSES)
+        orders, _ = await _list_orders(f"status NOT IN ({final})", [], limit + 1)
+    return orders[:limit], len(orders) > limit
+
+async def get_orders_by_customer(customer_name: str, limit: int = None, cursor: str = None, selection: Selection = None, prefix: bool = False) -> Tuple[List[schemas.Order], Optional[str]]:
+    """
+    Order history of the customers with this name, ignoring case and extra
+    spaces; with `prefix`, of every customer whose name starts with it.
+    Served by orders_customer_name_idx (009_customer_lookup_indexes.sql).
+    """
+    name = normalize_name(customer_name)
+    if not name:
+        raise ValueError("Customer name is empty")
+    if prefix:
+        condition = "normalize_name(customer_name) ~>=~ $1 AND normalize_name(customer_name) ~<~ $2"
+        return await _list_orders(condition, list(prefix_range(name)), limit, cursor, selection)
+    return await _list_orders("normalize_name(customer_name) = $1", [name], limit, cursor, selection)
+
+async def get_orders_by_phone(phone: str, limit: int = None, cursor: str = None, selection: Selection = None, prefix: bool = False) -> Tuple[List[schemas.Order], Optional[str]]:
+    """Order history for a phone number, compared by its digits only; with `prefix`, for every number starting with them."""
+    digits = normalize_phone(phone)
+    if not digits:
+        raise ValueError("Phone number has no digits")
+    if prefix:
+        condition = "normalize_phone(customer_phone) ~>=~ $1 AND normalize_phone(customer_phone) ~<~ $2"
+        return await _list_orders(condition, list(prefix_range(digits)), limit, cursor, selection)
+    return await _list_orders("normalize_phone(customer_phone) = $1", [digits], limit, cursor, selection)
 
 async def update_order_status(order_id: int, status: str) -> schemas.Order:
-    from datetime import datetime
-    response = supabase.from_("orders").update({"status": status, "updated_at": datetime.now().isoformat()}).eq("id", order_id).execute()
-    if response.data:
-        return schemas.Order(**response.data[0])
-    return None
+    async with db.transaction() as conn:
+        row = await conn.fetchrow(
+            "UPDATE orders SET status = $1, updated_at = $2 "
+            "FROM (SELECT id, status FROM orders WHERE id = $3 FOR UPDATE) AS previous "
+            "WHERE orders.id = previous.id RETURNING orders.*, previous.status AS previous_status",
+            status, datetime.now(), order_id,
+        )
+        if not row:
+            return None
+        previous_status = row.pop('previous_status')
+        await order_events.record(conn, "order_status_changed", row, previous_status)
+
+    revenue_counters.record_status_change(row, previous_status)
+    return construct(schemas.Order, row)
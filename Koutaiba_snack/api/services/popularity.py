@@ -0,0 +1,78 @@
+
+import heapq
+import os
+import time
+from datetime import date, datetime, timezone
+from api.database import db
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Counters are periodically reloaded from the item_sales_daily rollup to pick
+# up orders taken by other workers.
+RESYNC_SECONDS = float(os.environ.get("POPULARITY_RESYNC_SECONDS", 60))
+
+
+class PopularityCounters:
+    """
+    Quantity-weighted sales per item, all-time and per day.
+
+    Mirrors the item_sales_daily rollup table, so its size depends on the
+    number of items and days, not on the number of order lines. Top-K is
+    taken with a heap over the per-item totals of the requested window.
+    """
+
+    def __init__(self):
+        self._totals: Dict[int, List[int]] = {}
+        self._days: Dict[date, Dict[int, List[int]]] = {}
+        self.synced_at = 0.0
+
+    def add(self, day: date, item_id: int, quantity: int, lines: int = 1) -> None:
+        for counts in (self._totals.setdefault(item_id, [0, 0]), self._days.setdefault(day, {}).setdefault(item_id, [0, 0])):
+            counts[0] += quantity
+            counts[1] += lines
+
+    def replace(self, rows: Iterable[dict]) -> None:
+        """Swaps in counters loaded from item_sales_daily rows."""
+        self._totals, self._days = {}, {}
+        for row in rows:
+            self.add(row['day'], row['item_id'], int(row['quantity']), int(row['lines']))
+        self.synced_at = time.monotonic()
+
+    def top(self, k: int, since: Optional[date] = None, item_ids: Optional[set] = None) -> List[Tuple[int, int, int]]:
+        """
+        Returns the `k` best sellers as (item_id, quantity, lines), most sold first.
+
+        Args:
+            k: How many items to return.
+            since: Only count days from this one on; all-time if omitted.
+            item_ids: Only consider these items, e.g. one category.
+        """
+        if since is None:
+            totals = self._totals
+        else:
+            totals = {}
+            for day, items in self._days.items():
+                if day < since:
+                    continue
+                for item_id, (quantity, lines) in items.items():
+                    counts = totals.setdefault(item_id, [0, 0])
+                    counts[0] += quantity
+                    counts[1] += lines
+        candidates = ((item_id, counts[0], counts[1]) for item_id, counts in totals.items() if item_ids is None or item_id in item_ids)
+        return heapq.nlargest(k, candidates, key=lambda entry: (entry[1], -entry[0]))
+
+
+counters = PopularityCounters()
+
+async def rebuild() -> None:
+    counters.replace(await db.fetch("SELECT item_id, day, quantity, lines FROM item_sales_daily"))
+
+async def ensure_fresh() -> None:
+    if time.monotonic() - counters.synced_at >= RESYNC_SECONDS:
+        await rebuild()
+
+def record_order(order: dict, lines: Iterable[Tuple[int, int]]) -> None:
+    """Counts the (item_id, quantity) lines of a newly created order."""
+    created_at = order.get('created_at') or datetime.now(timezone.utc)
+    day = created_at.astimezone(timezone.utc).date()
+    for item_id, quantity in lines:
+        counters.add(day, item_id, quantity)
@@ -0,0 +1,197 @@
+
+import asyncio
+import os
+from api.database import db
+from api.utils.cache import SnapshotCache
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class RecipeMatrix:
+    """
+    Every recipe as one item x ingredient matrix, plus the current stock vector.
+
+    A cart's combined ingredient demand is a single vector-matrix product, and
+    the maximum makeable quantity of every item is one vectorized pass over
+    the matrix, so both cost the same whatever the cart or menu size.
+
+    The recipes are immutable for the lifetime of the matrix; the stock
+    vector is updated in place as stock changes come in. A reverse index from
+    each ingredient to the items using it means a stock change only
+    re-evaluates whether those items can still be made at all.
+    """
+
+    def __init__(self, version: int, recipe_rows: List[dict], stock_rows: List[dict]):
+        self.version = version
+        self.item_ids: List[int] = []
+        self.item_names: Dict[int, str] = {}
+        for row in recipe_rows:
+            if row['item_id'] not in self.item_names:
+                self.item_ids.append(row['item_id'])
+                self.item_names[row['item_id']] = row['item_name']
+        self.item_index = {item_id: index for index, item_id in enumerate(self.item_ids)}
+
+        self.ingredient_ids = [row['id'] for row in stock_rows]
+        self.ingredient_names = {row['id']: row['name'] for row in stock_rows}
+        self.ingredient_index = {ingredient_id: index for index, ingredient_id in enumerate(self.ingredient_ids)}
+        self.stock = np.array([float(row['current_stock']) for row in stock_rows], dtype=np.float64)
+
+        self.recipes = np.zeros((len(self.item_ids), len(self.ingredient_ids)), dtype=np.float64)
+        for row in recipe_rows:
+            if row['ingredient_id'] is not None and row['ingredient_id'] in self.ingredient_index:
+                self.recipes[self.item_index[row['item_id']], self.ingredient_index[row['ingredient_id']]] = float(row['quantity_required'])
+        self.has_recipe = self.recipes.any(axis=1)
+
+        self.items_using = [np.nonzero(self.recipes[:, column])[0] for column in range(len(self.ingredient_ids))]
+        self.in_stock = self._can_make_one(np.arange(len(self.item_ids)))
+        self.out_of_stock = {self.item_ids[index] for index in np.nonzero(~self.in_stock)[0]}
+        # Bumped whenever an item goes in or out of stock.
+        self.availability_version = 0
+
+    def _can_make_one(self, rows: np.ndarray) -> np.ndarray:
+        recipes = self.recipes[rows]
+        return ((recipes == 0) | (recipes <= self.stock)).all(axis=1)
+
+    def set_stock(self, changes: Dict[int, float]) -> bool:
+        """
+        Applies new stock levels and updates the availability of just the
+        items using those ingredients. Returns False if an ingredient is
+        unknown and the matrix needs a reload.
+        """
+        complete = True
+        affected = []
+        for ingredient_id, current_stock in changes.items():
+            index = self.ingredient_index.get(ingredient_id)
+            if index is None:
+                complete = False
+            elif self.stock[index] != current_stock:
+                self.stock[index] = current_stock
+                affected.append(self.items_using[index])
+        if affected:
+            rows = np.unique(np.concatenate(affected))
+            in_stock = self._can_make_one(rows)
+            flipped = rows[in_stock != self.in_stock[rows]]
+            if len(flipped):
+                self.in_stock[rows] = in_stock
+                for row in flipped:
+                    if self.in_stock[row]:
+                        self.out_of_stock.discard(self.item_ids[row])
+                    else:
+                        self.out_of_stock.add(self.item_ids[row])
+                self.availability_version += 1
+        return complete
+
+    def is_in_stock(self, item_id: int) -> bool:
+        """Whether current stock covers at least one of the item; items without a recipe never run out."""
+        return item_id not in self.out_of_stock
+
+    def check_cart(self, cart: Dict[int, int]) -> dict:
+        """
+        Checks whether a whole cart can be made from current stock.
+
+        Args:
+            cart: Quantity per item id.
+
+        Returns:
+            {"can_be_made", "shortfalls", "unknown_items"}: shortfalls lists
+            every ingredient the cart needs more of than is in stock, and
+            unknown_items the item ids that don't exist or have no recipe.
+        """
+        quantities = np.zeros(len(self.item_ids), dtype=np.float64)
+        unknown_items = []
+        for item_id, quantity in cart.items():
+            index = self.item_index.get(item_id)
+            if index is None or not self.has_recipe[index]:
+                unknown_items.append(item_id)
+            else:
+                quantities[index] += quantity
+
+        demand = quantities @ self.recipes
+        short = np.nonzero(demand > self.stock + 1e-9)[0]
+        shortfalls = [
+            {
+                "ingredient_id": self.ingredient_ids[index],
+                "name": self.ingredient_names[self.ingredient_ids[index]],
+                "required": float(demand[index]),
+                "available": float(self.stock[index]),
+            }
+            for index in short
+        ]
+        return {
+            "can_be_made": not shortfalls and not unknown_items,
+            "shortfalls": shortfalls,
+            "unknown_items": sorted(unknown_items),
+        }
+
+    def max_makeable(self) -> np.ndarray:
+        """How many of each item (in `item_ids` order) current stock allows, on its own."""
+        if not len(self.ingredient_ids):
+            return np.zeros(len(self.item_ids), dtype=np.int64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = np.where(self.recipes > 0, np.maximum(self.stock, 0) / self.recipes, np.inf)
+        makeable = np.floor(ratios.min(axis=1) + 1e-9)
+        makeable[~self.has_recipe] = 0
+        return makeable.astype(np.int64)
+
+
+async def _load_matrix(version: int) -> RecipeMatrix:
+    recipe_rows, stock_rows = await asyncio.gather(
+        db.fetch(
+            "SELECT i.id AS item_id, i.name AS item_name, ii.ingredient_id, ii.quantity_required "
+            "FROM items i LEFT JOIN item_ingredients ii ON ii.item_id = i.id ORDER BY i.id"
+        ),
+        db.fetch("SELECT id, name, current_stock FROM ingredients ORDER BY id"),
+    )
+    return RecipeMatrix(version, recipe_rows, stock_rows)
+
+
+# Recipes change via `menu_changed` and stock via `stock_changed` notifications;
+# the TTL only bounds staleness when the listener is not running.
+_cache = SnapshotCache(_load_matrix, ttl=float(os.environ.get("RECIPE_MATRIX_TTL", 60)), name="recipe_matrix")
+
+async def get_matrix() -> RecipeMatrix:
+    return await _cache.get()
+
+def invalidate(payload: str = None) -> None:
+    """Drops the matrix; the next read reloads recipes and stock. Used as the `menu_changed` NOTIFY callback."""
+    _cache.invalidate()
+
+def record_stock(rows: Iterable[dict]) -> None:
+    """Applies ingredient rows this worker just wrote, so its own reads see them straight away."""
+    matrix = _cache.peek()
+    if matrix is None or _cache.loading:
+        # A load in flight may have read the stock before this write: don't keep it.
+        _cache.invalidate()
+        return
+    changes = {row['id']: float(row['current_stock']) for row in rows if row and row.get('id') is not None}
+    if not matrix.set_stock(changes):
+        _cache.invalidate()
+
+def apply_stock_notification(payload: str) -> None:
+    """`stock_changed` NOTIFY callback: the payload is "id:stock,..." or empty for "reload everything"."""
+    matrix = _cache.peek()
+    if matrix is None or _cache.loading or not payload:
+        # A load in flight may have read the stock before this change: don't keep it.
+        _cache.invalidate()
+        return
+    changes = {}
+    for pair in payload.split(","):
+        ingredient_id, _, current_stock = pair.partition(":")
+        changes[int(ingredient_id)] = float(current_stock)
+    if not matrix.set_stock(changes):
+        _cache.invalidate()
+
+async def check_cart(cart: Dict[int, int]) -> dict:
+    return (await _cache.get()).check_cart(cart)
+
+async def get_max_makeable(item_ids: Optional[List[int]] = None) -> List[dict]:
+    """Returns {"item_id", "name", "max_quantity"} for every item (or the given ones) with a recipe."""
+    matrix = await _cache.get()
+    makeable = matrix.max_makeable()
+    wanted = set(item_ids) if item_ids else None
+    return [
+        {"item_id": item_id, "name": matrix.item_names[item_id], "max_quantity": int(makeable[index])}
+        for index, item_id in enumerate(matrix.item_ids)
+        if matrix.has_recipe[index] and (wanted is None or item_id in wanted)
+    ]
@@ -0,0 +1,129 @@
+
+import bisect
+import math
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from api.database import db
+from typing import Dict, List, Optional, Tuple
+
+# Orders in these statuses don't count towards revenue.
+EXCLUDED_STATUSES = ("cancelled", "canceled")
+
+BUCKET_SECONDS = int(os.environ.get("REVENUE_BUCKET_SECONDS", 300))
+RETENTION_DAYS = int(os.environ.get("REVENUE_RETENTION_DAYS", 35))
+# Each worker only sees its own writes, so the counters are periodically
+# rebuilt from the database to pick up orders taken by other workers.
+RESYNC_SECONDS = float(os.environ.get("REVENUE_RESYNC_SECONDS", 60))
+
+
+class RevenueCounters:
+    """
+    Rolling revenue and order counts held in fixed-size time buckets.
+
+    A window query sums the buckets it covers, so it costs O(buckets in the
+    window) regardless of how many orders they hold. Only buckets wholly
+    inside the window count; exact_window adds the orders of the partial
+    buckets at its edges.
+    """
+
+    def __init__(self, bucket_seconds: int = BUCKET_SECONDS, retention_days: int = RETENTION_DAYS):
+        self.bucket_seconds = bucket_seconds
+        self.retention = timedelta(days=retention_days)
+        self._buckets: Dict[int, List[float]] = {}
+        self._keys: List[int] = []
+        self.synced_at = 0.0
+
+    def bucket_of(self, when: datetime) -> int:
+        return int(when.timestamp()) // self.bucket_seconds * self.bucket_seconds
+
+    def bucket_after(self, when: datetime) -> int:
+        """The first bucket starting at or after `when`."""
+        return math.ceil(when.timestamp() / self.bucket_seconds) * self.bucket_seconds
+
+    def add(self, bucket: int, revenue: float, orders: int = 1) -> None:
+        counts = self._buckets.get(bucket)
+        if counts is None:
+            counts = self._buckets[bucket] = [0.0, 0]
+            bisect.insort(self._keys, bucket)
+        counts[0] += revenue
+        counts[1] += orders
+
+    def replace(self, rows: List[dict]) -> None:
+        """Swaps in buckets rebuilt from history, as {"bucket", "revenue", "orders"} rows."""
+        self._buckets = {int(row['bucket']): [float(row['revenue'] or 0), int(row['orders'])] for row in rows}
+        self._keys = sorted(self._buckets)
+        self.synced_at = time.monotonic()
+
+    def window(self, start: datetime, end: Optional[datetime] = None) -> Tuple[float, int]:
+        """Returns (revenue, orders) of the buckets wholly inside [start, end)."""
+        first = bisect.bisect_left(self._keys, self.bucket_after(start))
+        last = bisect.bisect_left(self._keys, self.bucket_of(end)) if end else len(self._keys)
+        revenue, orders = 0.0, 0
+        for key in self._keys[first:last]:
+            counts = self._buckets[key]
+            revenue += counts[0]
+            orders += counts[1]
+        return revenue, orders
+
+
+counters = RevenueCounters()
+
+async def rebuild() -> None:
+    """Reloads the buckets from the orders table, aggregated in the database."""
+    since = datetime.now(timezone.utc) - counters.retention
+    rows = await db.fetch(
+        "SELECT (floor(extract(epoch FROM created_at) / $1) * $1)::bigint AS bucket, "
+        "SUM(total_amount) AS revenue, COUNT(*) AS orders FROM orders "
+        f"WHERE created_at >= $2 AND status NOT IN ({db.placeholders(len(EXCLUDED_STATUSES), start=3)}) "
+        "GROUP BY 1",
+        counters.bucket_seconds, since, *EXCLUDED_STATUSES,
+    )
+    counters.replace(rows)
+
+async def query_window(start: datetime, end: Optional[datetime] = None) -> Tuple[float, int]:
+    """Returns (revenue, orders) for orders created in [start, end), aggregated in the database."""
+    row = await db.fetchrow(
+        "SELECT COALESCE(SUM(total_amount), 0) AS revenue, COUNT(*) AS orders FROM orders "
+        "WHERE created_at >= $1 AND ($2::timestamptz IS NULL OR created_at < $2) "
+        f"AND status NOT IN ({db.placeholders(len(EXCLUDED_STATUSES), start=3)})",
+        start, end, *EXCLUDED_STATUSES,
+    )
+    return float(row['revenue']), row['orders']
+
+async def exact_window(start: datetime, end: Optional[datetime] = None) -> Tuple[float, int]:
+    """
+    Returns (revenue, orders) for orders created in [start, end): the buckets
+    wholly inside the window from memory, the partial ones at its edges
+    (each shorter than a bucket) from the database.
+    """
+    inner_start = counters.bucket_after(start)
+    inner_end = counters.bucket_of(end) if end else None
+    if inner_end is not None and inner_start >= inner_end:
+        return await query_window(start, end)
+    inner_start = datetime.fromtimestamp(inner_start, timezone.utc)
+    inner_end = datetime.fromtimestamp(inner_end, timezone.utc) if end else None
+    revenue, orders = counters.window(inner_start, inner_end)
+    for low, high in ((start, inner_start), (inner_end, end)):
+        if high is not None and low < high:
+            edge_revenue, edge_orders = await query_window(low, high)
+            revenue += edge_revenue
+            orders += edge_orders
+    return revenue, orders
+
+async def ensure_fresh() -> None:
+    if time.monotonic() - counters.synced_at >= RESYNC_SECONDS:
+        await rebuild()
+
+def record_order(order: dict) -> None:
+    """Counts a newly created order."""
+    if order.get('status') not in EXCLUDED_STATUSES:
+        counters.add(counters.bucket_of(order['created_at']), float(order.get('total_amount') or 0))
+
+def record_status_change(order: dict, previous_status: str) -> None:
+    """Adds or removes an order's revenue when it moves into or out of an excluded status."""
+    was_counted = previous_status not in EXCLUDED_STATUSES
+    is_counted = order.get('status') not in EXCLUDED_STATUSES
+    if was_counted != is_counted:
+        sign = 1 if is_counted else -1
+        counters.add(counters.bucket_of(order['created_at']), sign * float(order.get('total_amount') or 0), sign)
@@ -0,0 +1,66 @@
+
+import json
+from api.database import db
+from api.utils.events import EventHub
+from api.utils.log import get_logger
+from typing import Iterable, List
+
+CHANNEL = "stock_alert"
+
+# Keeps every NOTIFY payload well under Postgres' 8000 byte limit.
+_ALERTS_PER_NOTIFY = 20
+
+logger = get_logger(__name__)
+
+hub = EventHub("low_stock")
+
+
+def crossings(rows: Iterable[dict]) -> List[dict]:
+    """
+    Picks the ingredients whose stock just crossed their minimum level.
+
+    Each row needs `previous_stock` next to the updated ingredient columns.
+    Falling to or below `min_stock_level` is a "low_stock" alert, climbing
+    back above it a "restocked" one.
+    """
+    alerts = []
+    for row in rows:
+        if row.get('previous_stock') is None or row.get('current_stock') is None:
+            continue
+        was_low = row['previous_stock'] <= row['min_stock_level']
+        is_low = row['current_stock'] <= row['min_stock_level']
+        if was_low != is_low:
+            alerts.append({
+                "event": "low_stock" if is_low else "restocked",
+                "ingredient_id": row['id'],
+                "name": row['name'],
+                "unit": row.get('unit'),
+                "current_stock": float(row['current_stock']),
+                "min_stock_level": float(row['min_stock_level']),
+            })
+    return alerts
+
+
+async def notify_crossings(conn: db.Connection, rows: Iterable[dict]) -> List[dict]:
+    """
+    Queues an alert for every threshold crossing among `rows`.
+
+    The NOTIFY is issued on the writing transaction, so Postgres delivers it
+    to every worker only once the stock change commits, and never for a
+    write that rolls back. Costs nothing when no threshold is crossed.
+    """
+    alerts = crossings(rows)
+    for start in range(0, len(alerts), _ALERTS_PER_NOTIFY):
+        await conn.execute("SELECT pg_notify($1, $2)", CHANNEL, json.dumps(alerts[start:start + _ALERTS_PER_NOTIFY]))
+    return alerts
+
+
+def on_notification(payload: str) -> None:
+    """`stock_alert` NOTIFY callback: fans the alerts out to this worker's subscribers."""
+    try:
+        alerts = json.loads(payload)
+    except ValueError:
+        logger.warning("malformed stock alert", extra={"payload": payload[:200]})
+        return
+    for alert in alerts:
+        hub.publish(alert.pop("event"), alert)
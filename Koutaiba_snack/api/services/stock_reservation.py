@@ -0,0 +1,143 @@
+
+from api.database import db
+from api.services import stock_alerts
+from typing import Dict, List, Tuple
+
+
+class InsufficientStockError(Exception):
+    """Raised when a reservation cannot be met; nothing has been decremented."""
+
+    def __init__(self, shortfalls: List[dict]):
+        self.shortfalls = shortfalls
+        names = ", ".join(row['name'] for row in shortfalls)
+        super().__init__(f"Not enough stock for item: {names}")
+
+
+async def reserve(conn: db.Connection, demand: Dict[int, float]) -> List[dict]:
+    """
+    Decrements every ingredient in `demand` by its quantity, or none of them.
+
+    Must run inside `db.transaction()`. The ingredient rows are locked in id
+    order, so concurrent orders only contend on the ingredients they share and
+    cannot deadlock each other, then checked and decremented with one
+    set-based update. Raising rolls back the caller's transaction, so a
+    rejected order leaves no partial decrements behind.
+
+    Args:
+        conn: Connection of the surrounding transaction.
+        demand: Quantity to take per ingredient id.
+
+    Returns:
+        The updated ingredient rows, with their `previous_stock`.
+    """
+    if not demand:
+        return []
+    ingredient_ids = sorted(demand)
+    locked = await conn.fetch(
+        "SELECT id, name, current_stock FROM ingredients "
+        f"WHERE id IN ({db.placeholders(len(ingredient_ids))}) ORDER BY id FOR UPDATE",
+        *ingredient_ids,
+    )
+    shortfalls = [row for row in locked if row['current_stock'] < demand[row['id']]]
+    missing = set(ingredient_ids) - {row['id'] for row in locked}
+    shortfalls += [{"id": ingredient_id, "name": f"ingredient {ingredient_id}"} for ingredient_id in sorted(missing)]
+    if shortfalls:
+        raise InsufficientStockError(shortfalls)
+
+    decrements, args = db.values_rows([(ingredient_id, demand[ingredient_id]) for ingredient_id in ingredient_ids], casts=("int", "numeric"))
+    rows = await conn.fetch(
+        "UPDATE ingredients SET current_stock = ingredients.current_stock - d.column2 "
+        f"FROM (VALUES {decrements}) AS d WHERE ingredients.id = d.column1 "
+        "RETURNING ingredients.*, ingredients.current_stock + d.column2 AS previous_stock",
+        *args,
+    )
+    await stock_alerts.notify_crossings(conn, rows)
+    return rows
+
+
+async def adjust(conn: db.Connection, ingredient_id: int, delta: float) -> dict:
+    """
+    Atomically adds `delta` (negative to take stock) to one ingredient.
+
+    The arithmetic happens in the database, so concurrent adjustments never
+    overwrite each other. Returns None if the ingredient does not exist and
+    raises InsufficientStockError if the result would go below zero.
+    """
+    row = await conn.fetchrow(
+        "UPDATE ingredients SET current_stock = current_stock + $1 "
+        "WHERE id = $2 AND current_stock + $1 >= 0 RETURNING *, current_stock - $1 AS previous_stock",
+        delta, ingredient_id,
+    )
+    if row is None:
+        existing = await conn.fetchrow("SELECT id, name FROM ingredients WHERE id = $1", ingredient_id)
+        if existing:
+            raise InsufficientStockError([existing])
+        return None
+    await stock_alerts.notify_crossings(conn, [row])
+    return row
+
+
+async def set_level(conn: db.Connection, ingredient_id: int, quantity: float) -> dict:
+    """Sets one ingredient's stock to `quantity`. Returns None if it does not exist."""
+    row = await conn.fetchrow(
+        "UPDATE ingredients SET current_stock = $1 "
+        "FROM (SELECT id, current_stock FROM ingredients WHERE id = $2 FOR UPDATE) previous "
+        "WHERE ingredients.id = previous.id RETURNING ingredients.*, previous.current_stock AS previous_stock",
+        quantity, ingredient_id,
+    )
+    if row is not None:
+        await stock_alerts.notify_crossings(conn, [row])
+    return row
+
+
+async def apply_batch(conn: db.Connection, changes: Dict[int, Tuple[bool, float]], atomic: bool = True) -> List[dict]:
+    """
+    Applies many stock changes in a single statement.
+
+    Each change is (absolute, value): absolute changes set the stock to
+    `value`, relative ones add `value` to it in the database. The rows are
+    locked, the new levels computed and written in one round trip, whatever
+    the batch size. A change that would leave an ingredient below zero is not
+    applied; with `atomic` set, nothing in the batch is applied if any change
+    fails or targets a missing ingredient.
+
+    Args:
+        conn: Connection to run on.
+        changes: (absolute, value) per ingredient id.
+        atomic: Apply all changes or none.
+
+    Returns:
+        One row per requested ingredient id, in id order, with the
+        `ingredient_name`, `previous_stock` and `requested_stock` (None if
+        the ingredient does not exist) and the updated ingredient columns
+        (None if the change was not applied).
+    """
+    if not changes:
+        return []
+    ingredient_ids = sorted(changes)
+    rows, args = db.values_rows(
+        [(ingredient_id, *changes[ingredient_id]) for ingredient_id in ingredient_ids],
+        casts=("int", "boolean", "numeric"),
+    )
+    guard = (
+        f"AND (SELECT count(*) FROM target) = {len(ingredient_ids)} "
+        "AND NOT EXISTS (SELECT 1 FROM target WHERE requested_stock < 0)"
+    ) if atomic else ""
+    results = await conn.fetch(
+        f"WITH d AS (VALUES {rows}), "
+        "target AS ("
+        "SELECT g.id, g.name, g.current_stock AS previous_stock, "
+        "CASE WHEN d.column2 THEN d.column3 ELSE g.current_stock + d.column3 END AS requested_stock "
+        "FROM ingredients g JOIN d ON g.id = d.column1 ORDER BY g.id FOR UPDATE OF g), "
+        "updated AS ("
+        "UPDATE ingredients SET current_stock = target.requested_stock FROM target "
+        f"WHERE ingredients.id = target.id AND target.requested_stock >= 0 {guard} "
+        "RETURNING ingredients.*) "
+        "SELECT d.column1 AS ingredient_id, target.name AS ingredient_name, target.previous_stock, "
+        "target.requested_stock, updated.* "
+        "FROM d LEFT JOIN target ON target.id = d.column1 LEFT JOIN updated ON updated.id = d.column1 "
+        "ORDER BY d.column1",
+        *args,
+    )
+    await stock_alerts.notify_crossings(conn, results)
+    return results
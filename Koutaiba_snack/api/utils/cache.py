@@ -0,0 +1,64 @@
+
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+from api.utils.singleflight import SingleFlight, reads
+
+
+class SnapshotCache:
+    """
+    In-process read-through cache holding one immutable snapshot.
+
+    The snapshot is rebuilt by `loader` on the first read after `ttl` seconds
+    or after `invalidate()`. Every build gets the next version number, which
+    the loader receives so it can stamp the snapshot with it. Reads arriving
+    while a snapshot is being built share that build.
+    """
+
+    def __init__(self, loader: Callable[[int], Awaitable[Any]], ttl: float, name: str = "snapshot"):
+        self._loader = loader
+        self.ttl = ttl
+        self.name = name
+        self.version = 0
+        self._snapshot: Optional[Any] = None
+        self._expires_at = 0.0
+        self._generation = 0
+        # Generation each running load started in.
+        self._loads: List[int] = []
+        self._flight = SingleFlight(name)
+
+    async def get(self) -> Any:
+        if self._snapshot is not None and time.monotonic() < self._expires_at:
+            reads.inc(self.name, "hit")
+            return self._snapshot
+        return await self._flight.do(None, self._load)
+
+    async def _load(self) -> Any:
+        generation = self._generation
+        self.version += 1
+        self._loads.append(generation)
+        try:
+            snapshot = await self._loader(self.version)
+        finally:
+            self._loads.remove(generation)
+        # A write that invalidated the cache while we were loading may not be
+        # in this snapshot: serve it to this caller but don't keep it.
+        if generation == self._generation:
+            self._snapshot = snapshot
+            self._expires_at = time.monotonic() + self.ttl
+        return snapshot
+
+    def peek(self) -> Optional[Any]:
+        """Returns the current snapshot without loading one, or None."""
+        return self._snapshot
+
+    @property
+    def loading(self) -> bool:
+        """Whether a load is running whose snapshot would be kept."""
+        return self._generation in self._loads
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        # A build in flight may predate the write; later reads start a new one.
+        self._flight.forget()
+        self._snapshot = None
+        self._expires_at = 0.0
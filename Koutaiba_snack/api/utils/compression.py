@@ -0,0 +1,166 @@
+
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from api.utils import metrics
+from api.utils.responses import etag_matches
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Below this many bytes compression saves less than it costs.
+MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 5))
+
+_COMPRESSIBLE = (b"application/json", b"text/")
+# Always streamed: their headers go out at once, before any event is ready.
+_STREAMED = (b"text/event-stream",)
+# Compressed bodies by (content hash, encoding); the hot payloads repeat, so
+# most responses are compressed once rather than per request.
+_CACHE_SIZE = 128
+
+response_bytes = metrics.registry.counter(
+    "http_response_bytes_total",
+    "GET response body bytes as produced (stage=identity) and as sent (stage=sent, by encoding).",
+    ("encoding", "stage"),
+)
+not_modified = metrics.registry.counter("http_not_modified_total", "GET requests answered with 304 Not Modified.")
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Picks "br" (if brotli is installed) or "gzip" from an Accept-Encoding header, or None."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    wildcard = accepted.get("*", 0.0)
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware for conditional GETs and compressed responses.
+
+    Every complete 200 response to a GET gets a strong ETag hashed from its
+    body (unless the endpoint set one) and is answered with a bodiless 304
+    when the client's If-None-Match already has it. Bodies of at least
+    MINIMUM_SIZE bytes are then sent brotli- or gzip-compressed when the
+    client accepts it, with the ETag made weak as the bytes differ.
+
+    Streaming responses (several body messages) pass through untouched, and
+    Server-Sent Events streams are passed on from their very first message.
+    """
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self._compressed: "OrderedDict[Tuple[bytes, str], bytes]" = OrderedDict()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = scope["headers"]
+        accept_encoding = _header(request_headers, b"accept-encoding")
+        if_none_match = _header(request_headers, b"if-none-match")
+        encoding = choose_encoding(accept_encoding.decode("latin-1")) if accept_encoding else None
+        start: List[dict] = []
+        streaming = [False]
+
+        async def send_wrapper(message):
+            if streaming[0]:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                if (_header(message["headers"], b"content-type") or b"").startswith(_STREAMED):
+                    streaming[0] = True
+                    await send(message)
+                else:
+                    start.append(message)
+            elif message.get("more_body", False):
+                streaming[0] = True
+                await send(start[0])
+                await send(message)
+            else:
+                await self._finish(send, start[0], message.get("body", b""), if_none_match, encoding)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _finish(self, send, start: dict, body: bytes, if_none_match: Optional[bytes], encoding: Optional[str]):
+        headers = [(key, value) for key, value in start["headers"]]
+        if start["status"] != 200 or _header(headers, b"content-encoding") is not None:
+            if start["status"] == 304:
+                not_modified.inc()
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        etag = _header(headers, b"etag")
+        if etag is None:
+            etag = b'"' + digest.hex().encode("ascii") + b'"'
+            headers.append((b"etag", etag))
+        if _header(headers, b"cache-control") is None:
+            # Cache, but revalidate every time: the 304 makes that cheap.
+            headers.append((b"cache-control", b"no-cache"))
+        if if_none_match is not None and etag_matches(if_none_match.decode("latin-1"), etag.decode("latin-1")):
+            not_modified.inc()
+            keep = (b"etag", b"cache-control", b"vary")
+            await send({"type": "http.response.start", "status": 304, "headers": [(k, v) for k, v in headers if k.lower() in keep]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        content_type = _header(headers, b"content-type") or b""
+        sent_encoding = "identity"
+        response_bytes.inc("identity", "identity", amount=len(body))
+        if len(body) >= self.minimum_size and content_type.startswith(_COMPRESSIBLE):
+            headers.append((b"vary", b"Accept-Encoding"))
+            if encoding is not None:
+                sent_encoding = encoding
+                body = self._compress(digest, body, encoding)
+                headers = [
+                    (key, b"W/" + value if key.lower() == b"etag" and not value.startswith(b"W/") else value)
+                    for key, value in headers
+                    if key.lower() != b"content-length"
+                ]
+                headers += [(b"content-encoding", encoding.encode("ascii")), (b"content-length", str(len(body)).encode("ascii"))]
+        response_bytes.inc(sent_encoding, "sent", amount=len(body))
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    def _compress(self, digest: bytes, body: bytes, encoding: str) -> bytes:
+        key = (digest, encoding)
+        compressed = self._compressed.get(key)
+        if compressed is not None:
+            self._compressed.move_to_end(key)
+            return compressed
+        if encoding == "br":
+            compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+        else:
+            compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        self._compressed[key] = compressed
+        if len(self._compressed) > _CACHE_SIZE:
+            self._compressed.popitem(last=False)
+        return compressed
@@ -0,0 +1,126 @@
+
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Iterable, List, Optional, Set
+from api.utils import metrics
+from api.utils.serialization import dumps
+
+# An SSE comment line; keeps proxies from closing an idle stream.
+HEARTBEAT = b": keep-alive\n\n"
+
+subscribers = metrics.registry.gauge("event_subscribers", "Open event stream subscriptions.", ("hub",))
+dropped = metrics.registry.counter("events_dropped_total", "Events dropped for slow subscribers.", ("hub",))
+
+
+def format_event(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    """Encodes one Server-Sent Event with a JSON data line."""
+    head = f"id: {event_id}\nevent: {event}\n" if event_id is not None else f"event: {event}\n"
+    return head.encode("utf-8") + b"data: " + dumps(data) + b"\n\n"
+
+
+class Event:
+    """A published event. It is encoded once, however many subscribers receive it."""
+
+    __slots__ = ("id", "event", "data", "_encoded")
+
+    def __init__(self, event_id: int, event: str, data: Any):
+        self.id = event_id
+        self.event = event
+        self.data = data
+        self._encoded: Optional[bytes] = None
+
+    @property
+    def encoded(self) -> bytes:
+        if self._encoded is None:
+            self._encoded = format_event(self.event, self.data, self.id)
+        return self._encoded
+
+
+class EventHub:
+    """
+    In-process publish/subscribe for pushing events to streaming clients.
+
+    Every subscriber gets its own bounded queue, so publishing never waits on
+    a slow client: when a queue is full its oldest event is dropped. Events
+    are numbered in publish order unless the publisher passes its own id,
+    and the last `history` events are kept for clients that reconnect.
+    """
+
+    def __init__(self, name: str, queue_size: int = 256, history: int = 0):
+        self.name = name
+        self.queue_size = queue_size
+        self.last_id = 0
+        self._queues: Set[asyncio.Queue] = set()
+        self._history: Deque[Event] = deque(maxlen=history)
+
+    def __len__(self) -> int:
+        return len(self._queues)
+
+    def publish(self, event: str, data: Any, event_id: Optional[int] = None) -> Event:
+        self.last_id = event_id if event_id is not None else self.last_id + 1
+        message = Event(self.last_id, event, data)
+        if self._history.maxlen:
+            self._history.append(message)
+        for queue in self._queues:
+            if queue.full():
+                queue.get_nowait()
+                dropped.inc(self.name)
+            queue.put_nowait(message)
+        return message
+
+    def replay(self, last_id: int) -> Optional[List[Event]]:
+        """
+        Returns the events published after the one with id `last_id`, in
+        publish order, or None if that event is no longer in the history.
+        """
+        for position in range(len(self._history) - 1, -1, -1):
+            if self._history[position].id == last_id:
+                return list(self._history)[position + 1:]
+        return None
+
+    @contextmanager
+    def subscribe(self):
+        """Yields a queue receiving every event published while the block runs."""
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._queues.add(queue)
+        subscribers.inc(self.name)
+        try:
+            yield queue
+        finally:
+            self._queues.discard(queue)
+            subscribers.dec(self.name)
+
+
+async def stream_events(
+    queue: asyncio.Queue,
+    initial: Iterable[bytes] = (),
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    heartbeat: float = 15.0,
+    accept: Optional[Callable[[Event], bool]] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Turns a subscription queue into an SSE body for a StreamingResponse.
+
+    Sends `initial` first, then every queued event that `accept` lets
+    through, and a heartbeat comment whenever nothing was sent for
+    `heartbeat` seconds. Stops once `is_disconnected()` says the client has
+    gone.
+    """
+    for chunk in initial:
+        yield chunk
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + heartbeat
+    while True:
+        try:
+            # Drain what is already queued without arming a timer per event.
+            message = queue.get_nowait() if not queue.empty() else await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            if is_disconnected is not None and await is_disconnected():
+                return
+            yield HEARTBEAT
+            deadline = loop.time() + heartbeat
+            continue
+        if accept is None or accept(message):
+            yield message.encoded
+            deadline = loop.time() + heartbeat
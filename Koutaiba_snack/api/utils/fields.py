@@ -0,0 +1,69 @@
+
+from typing import Any, FrozenSet, Iterable, NamedTuple, Optional, Sequence, Tuple
+
+
+class Selection(NamedTuple):
+    """The columns (None for all of them) and embedded relations a client asked for."""
+    columns: Optional[Tuple[str, ...]]
+    include: FrozenSet[str]
+
+    def sql(self, *needed: str) -> str:
+        """The SELECT list: the selected columns plus those the query itself `needed`, e.g. for a cursor."""
+        if self.columns is None:
+            return "*"
+        return ", ".join(dict.fromkeys(self.columns + needed))
+
+    def project(self, row: Any) -> Any:
+        """Trims a row (or schema object) to the selected columns and included relations; a no-op without `fields`."""
+        if self.columns is None:
+            return row
+        get = row.get if isinstance(row, dict) else lambda name: getattr(row, name, None)
+        return {name: get(name) for name in self.columns + tuple(sorted(self.include))}
+
+
+class Fields:
+    """
+    The columns and embedded relations a client may select on one resource,
+    via `fields=` and `include=` query parameters.
+
+    Only names on the whitelist get anywhere near SQL, so the selected
+    columns can be put straight into the SELECT list.
+    """
+
+    def __init__(self, columns: Sequence[str], relations: Iterable[str] = (), always: Sequence[str] = ("id",)):
+        self.columns = tuple(columns)
+        self.relations = frozenset(relations)
+        self.always = tuple(always)
+
+    def select(self, fields: Optional[str] = None, include: Optional[str] = None, default_include: Iterable[str] = ()) -> Selection:
+        """
+        Parses comma-separated `fields` and `include` values.
+
+        Without `fields` every column is returned, without `include` the
+        `default_include` relations. The `always` columns are returned even
+        when not asked for.
+
+        Raises:
+            ValueError: on a column or relation not on the whitelist.
+        """
+        columns = None
+        if fields is not None:
+            names = [name.strip() for name in fields.split(",") if name.strip()]
+            unknown = [name for name in names if name not in self.columns]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(self.columns)}")
+            columns = tuple(dict.fromkeys(self.always + tuple(names)))
+
+        if include is None:
+            relations = frozenset(default_include)
+        else:
+            relations = frozenset(name.strip() for name in include.split(",") if name.strip())
+            unknown = sorted(relations - self.relations)
+            if unknown:
+                allowed = ", ".join(sorted(self.relations)) or "none"
+                raise ValueError(f"Unknown include: {', '.join(unknown)}. Allowed: {allowed}")
+        return Selection(columns, relations)
+
+    @property
+    def all(self) -> Selection:
+        return Selection(None, frozenset())
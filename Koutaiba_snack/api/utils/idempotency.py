@@ -0,0 +1,135 @@
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, NamedTuple, Optional, Tuple
+from api.utils import metrics
+
+# Same bound as Stripe's keys; plenty for a UUID.
+MAX_KEY_LENGTH = 255
+
+outcomes = metrics.registry.counter(
+    "idempotency_requests_total",
+    "Requests carrying an Idempotency-Key, by outcome (new, replayed, waited, conflict).",
+    ("store", "outcome"),
+)
+
+
+class StoredResponse(NamedTuple):
+    status_code: int
+    body: bytes
+    headers: Tuple[Tuple[str, str], ...] = ()
+
+
+class KeyReused(Exception):
+    """The key was already used for a request with a different body."""
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "expires_at", "result")
+
+    def __init__(self, fingerprint: str, result: "asyncio.Future[StoredResponse]"):
+        self.fingerprint = fingerprint
+        self.expires_at = float("inf")
+        self.result = result
+
+
+class IdempotencyStore:
+    """
+    Remembers responses by Idempotency-Key, so a retried request is answered
+    without running its handler again.
+
+    The first request with a key runs the handler; a copy of the same request
+    arriving while it runs waits for that attempt instead of racing it, and
+    later ones get the stored response for `ttl` seconds. Only responses with
+    a status below 500 are kept: after a server error or an exception the key
+    is released so the client's retry runs again. At most `max_keys` keys
+    are kept, least recently used first out, but never one whose request is
+    still running.
+
+    The store lives in this process only: a retry that reaches another
+    worker or API instance runs the handler again.
+    """
+
+    def __init__(self, name: str, max_keys: int = 10000, ttl: float = 86400.0):
+        self.name = name
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[StoredResponse]],
+    ) -> Tuple[StoredResponse, bool]:
+        """
+        Returns the response for `key` and whether it was replayed.
+
+        Raises:
+            KeyReused: if the key was used for a request with a different
+                `fingerprint`.
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                outcomes.inc(self.name, "conflict")
+                raise KeyReused(key)
+            outcome = "replayed" if entry.result.done() else "waited"
+            outcomes.inc(self.name, outcome)
+            # Shielded so a waiter that disconnects doesn't cancel the original attempt.
+            return await asyncio.shield(entry.result), True
+
+        outcomes.inc(self.name, "new")
+        entry = _Entry(fingerprint, asyncio.get_running_loop().create_future())
+        self._entries[key] = entry
+        self._evict()
+        try:
+            response = await handler()
+        except asyncio.CancelledError:
+            self._release(key, entry)
+            entry.result.cancel()
+            raise
+        except Exception as e:
+            self._release(key, entry)
+            entry.result.set_exception(e)
+            # Nobody may be waiting; don't let asyncio log the exception as never retrieved.
+            entry.result.exception()
+            raise
+        if response.status_code >= 500:
+            self._release(key, entry)
+        else:
+            entry.expires_at = time.monotonic() + self.ttl
+        entry.result.set_result(response)
+        return response, False
+
+    def _evict(self) -> None:
+        excess = len(self._entries) - self.max_keys
+        if excess <= 0:
+            return
+        # In-flight entries stay, or a copy arriving now would run the handler a second time.
+        stale = []
+        for key, entry in self._entries.items():
+            if len(stale) == excess:
+                break
+            if entry.result.done():
+                stale.append(key)
+        for key in stale:
+            del self._entries[key]
+
+    def _release(self, key: str, entry: _Entry) -> None:
+        if self._entries.get(key) is entry:
+            del self._entries[key]
@@ -0,0 +1,28 @@
+
+import re
+from typing import Tuple
+
+_NON_DIGITS = re.compile(r"\D")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_phone(phone: str) -> str:
+    """
+    Reduces a phone number to its digits, the rule of the agent's
+    utils.format_phone_number and of the normalize_phone SQL function.
+    """
+    return _NON_DIGITS.sub("", phone or "")
+
+
+def normalize_name(name: str) -> str:
+    """Trims, lowercases and collapses whitespace, like the normalize_name SQL function."""
+    return _WHITESPACE.sub(" ", name or "").strip(" ").lower()
+
+
+def prefix_range(value: str) -> Tuple[str, str]:
+    """
+    The bounds [low, high) of the strings starting with `value`, in code point
+    order. Compared with Postgres' ~>=~ and ~<~ operators they use a
+    text_pattern_ops index even in a generic plan, unlike LIKE $1.
+    """
+    return value, value[:-1] + chr(ord(value[-1]) + 1)
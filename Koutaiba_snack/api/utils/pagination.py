@@ -0,0 +1,54 @@
+
+import base64
+import json
+from typing import Any, Callable, List, Optional, Tuple
+
+# Page size used when a client sends a cursor without a limit.
+DEFAULT_PAGE_SIZE = 50
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Packs the sort key of the last row of a page into an opaque cursor."""
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """
+    Unpacks a cursor made by encode_cursor from a sort key of `size` values.
+
+    Raises:
+        ValueError: If the cursor was not produced by encode_cursor.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def paginate(rows: list, limit: Optional[int], key: Callable[[Any], List[Any]]) -> Tuple[list, Optional[str]]:
+    """
+    Trims a page that was fetched with `limit + 1` rows.
+
+    Args:
+        rows: The fetched rows, in page order.
+        limit: The page size, or None when the caller did not paginate.
+        key: Returns the sort key of a row, to resume after it.
+
+    Returns:
+        The page and the cursor of the next one, or None if this is the last.
+    """
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def page_meta(limit: Optional[int], cursor: Optional[str], next_cursor: Optional[str]) -> Optional[dict]:
+    """The json_response meta block of a paginated list, or None if the client did not paginate."""
+    if limit is None and cursor is None:
+        return None
+    return {"limit": limit or DEFAULT_PAGE_SIZE, "next_cursor": next_cursor}
@@ -1,39 +1,87 @@
 
-from fastapi.responses import JSONResponse
-from typing import Any, Optional
+import hashlib
+from fastapi.responses import Response, StreamingResponse
+from api.utils.serialization import dumps
+from typing import Any, Iterable, List, NamedTuple, Optional
+
+# The fixed parts of the response envelope, so only the message, data and
+# meta have to be serialized per response.
+_SUCCESS_PREFIX = b'{"success":true,"message":'
+_FAILURE_PREFIX = b'{"success":false,"message":'
+_DATA_KEY = b',"data":'
+_META_KEY = b',"meta":'
+_SUFFIX = b"}"
+
+
+def _envelope(success: bool, message: str, data_json: bytes, meta: Optional[dict] = None) -> bytes:
+    parts = [_SUCCESS_PREFIX if success else _FAILURE_PREFIX, dumps(message), _DATA_KEY, data_json]
+    if meta is not None:
+        parts += [_META_KEY, dumps(meta)]
+    parts.append(_SUFFIX)
+    return b"".join(parts)
 
 def json_response(
     data: Any = None,
     message: str = "Success",
     status_code: int = 200,
     success: bool = True,
-) -> JSONResponse:
+    meta: Optional[dict] = None,
+) -> Response:
     """
     Creates a unified JSON response for successful API calls.
 
     Args:
-        data: The payload to be included in the response.
+        data: The payload to be included in the response. Schema objects,
+            rows and lists of them are serialized directly, without a
+            jsonable_encoder pass.
         message: A descriptive message about the result.
         status_code: The HTTP status code.
         success: A boolean indicating the success of the operation.
+        meta: Optional metadata such as pagination cursors, added to the
+            envelope under "meta" only when given.
 
     Returns:
-        A FastAPI JSONResponse object.
+        A FastAPI Response with the JSON envelope.
     """
-    return JSONResponse(
+    return Response(
+        content=_envelope(success, message, dumps(data), meta),
         status_code=status_code,
-        content={
-            "success": success,
-            "message": message,
-            "data": data,
-        },
+        media_type="application/json",
     )
 
+def streamed_json_response(
+    chunks: Iterable[List[Any]],
+    message: str = "Success",
+    meta: Optional[dict] = None,
+) -> StreamingResponse:
+    """
+    Streams the same envelope as json_response around a long list.
+
+    Args:
+        chunks: Lists of rows, serialized one at a time and concatenated
+            into the `data` array, so the whole list is never encoded at once.
+        message: A descriptive message about the result.
+        meta: Optional metadata, sent after the data.
+
+    Returns:
+        A StreamingResponse with the JSON envelope.
+    """
+    async def body():
+        yield _SUCCESS_PREFIX + dumps(message) + _DATA_KEY + b"["
+        separator = b""
+        for chunk in chunks:
+            if chunk:
+                yield separator + dumps(chunk)[1:-1]
+                separator = b","
+        yield b"]" + (_META_KEY + dumps(meta) if meta is not None else b"") + _SUFFIX
+
+    return StreamingResponse(body(), media_type="application/json")
+
 def error_response(
     message: str = "An error occurred",
     status_code: int = 400,
     data: Any = None,
-) -> JSONResponse:
+) -> Response:
     """
     Creates a unified JSON response for failed API calls.
 
@@ -43,14 +91,69 @@ def error_response(
         data: Optional additional data about the error.
 
     Returns:
-        A FastAPI JSONResponse object.
+        A FastAPI Response with the JSON envelope.
     """
-    return JSONResponse(
+    return Response(
+        content=_envelope(False, message, dumps(data)),
         status_code=status_code,
-        content={
-            "success": False,
-            "message": message,
-            "data": data,
-        },
+        media_type="application/json",
     )
 
+
+class PreparedData(NamedTuple):
+    """A payload serialized once, together with its strong ETag."""
+    body: bytes
+    etag: str
+
+
+def prepare_data(data: Any) -> PreparedData:
+    """
+    Serializes a payload ahead of time so it can be served many times.
+
+    The bytes match what json_response would render for the same data, and
+    the ETag is a hash of those bytes, so it is identical across workers and
+    restarts for as long as the data does not change.
+
+    Args:
+        data: The payload, as would be passed to json_response.
+
+    Returns:
+        A PreparedData with the JSON bytes and the quoted ETag.
+    """
+    return prepare_body(dumps(data))
+
+
+def prepare_body(body: bytes) -> PreparedData:
+    """Wraps JSON bytes that are already serialized, e.g. joined from other prepared payloads."""
+    return PreparedData(body=body, etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Checks an If-None-Match header value against an ETag."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def prepared_json_response(
+    prepared: PreparedData,
+    message: str = "Success",
+    if_none_match: Optional[str] = None,
+) -> Response:
+    """
+    Creates the unified success response around an already serialized payload.
+
+    Args:
+        prepared: The payload from prepare_data.
+        message: A descriptive message about the result.
+        if_none_match: The request's If-None-Match header, if any.
+
+    Returns:
+        A 304 Not Modified if the client already has this payload, otherwise
+        the same envelope json_response produces, both carrying the ETag.
+    """
+    headers = {"ETag": prepared.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, prepared.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=_envelope(True, message, prepared.body), media_type="application/json", headers=headers)
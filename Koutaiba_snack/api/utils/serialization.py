@@ -0,0 +1,51 @@
+
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Type, TypeVar
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+Model = TypeVar("Model", bound=BaseModel)
+
+
+def construct(model: Type[Model], row: dict) -> Model:
+    """
+    Builds a schema object from a database row without validating it.
+
+    Rows coming back from our own tables already have the right types, so
+    validating them again on every read is wasted work. Use the normal
+    constructor for anything that comes from a client.
+    """
+    return model.model_construct(**row)
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(by_alias=True, warnings=False)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    return jsonable_encoder(obj)
+
+
+def dumps(data: Any) -> bytes:
+    """
+    Serializes a payload to compact UTF-8 JSON in a single pass.
+
+    Pydantic models, Decimals, datetimes and the other types the services
+    return are encoded directly, so callers don't need to run
+    jsonable_encoder first. Uses orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
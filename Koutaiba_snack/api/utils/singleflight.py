@@ -0,0 +1,50 @@
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from api.utils import metrics
+
+reads = metrics.registry.counter(
+    "coalesced_reads_total",
+    "Reads by outcome: hit (served from memory), call (queried the database) or coalesced (shared a query in flight).",
+    ("group", "outcome"),
+)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical reads into one call.
+
+    While a call for a key is in flight, every other caller asking for the
+    same key awaits that call and gets its result (or exception) instead of
+    issuing its own. The call runs as a task of its own, so a caller that
+    goes away doesn't cancel it for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            reads.inc(self.name, "call")
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+        else:
+            reads.inc(self.name, "coalesced")
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieve the exception so a call whose callers all went away isn't logged as unhandled.
+        if not task.cancelled():
+            task.exception()
+
+    def forget(self) -> None:
+        """
+        Detaches the calls in flight, e.g. after a write: their callers still
+        get their results, but later callers start a fresh call.
+        """
+        self._calls.clear()
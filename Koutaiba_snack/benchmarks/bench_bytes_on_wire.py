@@ -0,0 +1,112 @@
+"""
+Bytes on the wire for the endpoints tablets poll, with and without
+compression and conditional GETs.
+
+For every endpoint it fetches the response as a client without compression
+support, with gzip and with brotli (when the brotli package is installed),
+then repeats the request with the ETag it got, as a polling tablet does when
+nothing changed. Reports body bytes per request and the saving over a plain
+uncompressed re-download.
+
+Runs in-process against the embedded local Postgres (seeded like
+`benchmarks.load_api`) unless given a --dsn or a --base-url.
+
+Usage:
+    python -m benchmarks.bench_bytes_on_wire
+    python -m benchmarks.bench_bytes_on_wire --base-url http://localhost:8000 --json bytes.json
+"""
+import argparse
+import asyncio
+import json
+import os
+from typing import List
+
+import httpx
+
+from benchmarks.load_api import seed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENDPOINTS = [
+    "/menu",
+    "/menu/available",
+    "/menu/categories",
+    "/orders?limit=100",
+    "/orders/status/pending?limit=100",
+    "/orders/status/pending?limit=100&fields=status,table_number",
+    "/ingredients",
+    "/ingredients/low-stock",
+    "/analytics/popular-items",
+]
+
+
+async def measure(client: httpx.AsyncClient, path: str, encodings: List[str]) -> dict:
+    result = {"path": path}
+    etag = None
+    for encoding in encodings:
+        response = await client.get(path, headers={"Accept-Encoding": encoding})
+        # num_bytes_downloaded counts the body as sent, before httpx decodes it.
+        result[encoding] = response.num_bytes_downloaded
+        etag = response.headers.get("etag", etag)
+    revalidated = await client.get(path, headers={"Accept-Encoding": encodings[-1], "If-None-Match": etag or ""})
+    result["status_304"] = revalidated.status_code
+    result["revalidated"] = revalidated.num_bytes_downloaded
+    return result
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default="local://", help="database for the in-process app (default: embedded local Postgres)")
+    parser.add_argument("--base-url", help="measure a running server over HTTP instead of the in-process app")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    encodings = ["identity", "gzip"] + (["br"] if brotli is not None else [])
+    lifespan = None
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=30)
+    else:
+        os.environ["DATABASE_URL"] = args.dsn
+        from api.database import db
+        from api.main import app
+
+        await db.init_pool()
+        if await seed(200, 60, 20000, 7):
+            print("seeded 200 items, 60 ingredients, 20000 orders")
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=30)
+        lifespan = app.router.lifespan_context(app)
+
+    results = []
+    async with client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            for path in ENDPOINTS:
+                results.append(await measure(client, path, encodings))
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    best = encodings[-1]
+    print(f"{'endpoint':<58}" + "".join(f"{encoding:>10}" for encoding in encodings) + f"{'304':>8}{'saved':>8}")
+    for result in results:
+        saved = 1 - result[best] / result["identity"] if result["identity"] else 0.0
+        print(
+            f"{result['path']:<58}" + "".join(f"{result[encoding]:>10,}" for encoding in encodings)
+            + f"{result['revalidated']:>8,}{saved:>8.0%}"
+        )
+    totals = {encoding: sum(result[encoding] for result in results) for encoding in encodings}
+    print(
+        f"{'total':<58}" + "".join(f"{totals[encoding]:>10,}" for encoding in encodings)
+        + f"{sum(result['revalidated'] for result in results):>8,}{1 - totals[best] / totals['identity']:>8.0%}"
+    )
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""
+Concurrent-request throughput: blocking client vs pooled async client.
+
+The "before" handler mirrors the old services, which called the synchronous
+supabase client inside `async def` and blocked the event loop for the whole
+round trip. The "after" handler awaits the round trip through a bounded pool,
+like `api.database.db` does.
+
+Without --dsn both paths use a simulated round trip of --latency-ms. With
+--dsn the "after" path runs `SELECT pg_sleep(...)` through the real pool.
+
+Usage:
+    python -m benchmarks.bench_concurrency --requests 200 --concurrency 50
+    python -m benchmarks.bench_concurrency --dsn postgresql://... --pool-size 10
+"""
+import argparse
+import asyncio
+import os
+import time
+
+
+async def blocking_handler(latency: float) -> None:
+    time.sleep(latency)
+
+
+def make_pooled_handler(pool_size: int):
+    slots = asyncio.Semaphore(pool_size)
+
+    async def pooled_handler(latency: float) -> None:
+        async with slots:
+            await asyncio.sleep(latency)
+
+    return pooled_handler
+
+
+async def db_handler(latency: float) -> None:
+    from api.database import db
+    await db.fetchval("SELECT pg_sleep($1)", latency)
+
+
+async def run(handler, requests: int, concurrency: int, latency: float) -> float:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            await handler(latency)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return requests / (time.perf_counter() - started)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--dsn", default=None)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    before = await run(blocking_handler, args.requests, args.concurrency, latency)
+
+    if args.dsn:
+        os.environ["DB_POOL_MAX_SIZE"] = str(args.pool_size)
+        from api.database import db
+        await db.init_pool(args.dsn)
+        after = await run(db_handler, args.requests, args.concurrency, latency)
+        await db.close_pool()
+    else:
+        after = await run(make_pooled_handler(args.pool_size), args.requests, args.concurrency, latency)
+
+    print(f"requests={args.requests} concurrency={args.concurrency} latency={args.latency_ms}ms pool={args.pool_size}")
+    print(f"before (blocking client): {before:8.1f} req/s")
+    print(f"after  (pooled async):    {after:8.1f} req/s  ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+"""
+Event fan-out micro-benchmark for the SSE hubs behind /orders/stream and
+/ingredients/low-stock/stream.
+
+Opens --subscribers streams on one EventHub, each consuming through
+`stream_events` like a connected display, publishes --events order events
+and reports the publish cost and the delivery throughput.
+
+Usage:
+    python -m benchmarks.bench_event_fanout --subscribers 500 --events 2000
+"""
+import argparse
+import asyncio
+import time
+
+from api.utils.events import EventHub, stream_events
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=20, help="events published per event-loop tick")
+    args = parser.parse_args()
+
+    hub = EventHub("bench", queue_size=max(256, args.batch * 2))
+    received = [0]
+    done = asyncio.Event()
+    expected = args.subscribers * args.events
+
+    async def subscriber():
+        with hub.subscribe() as queue:
+            async for _ in stream_events(queue, heartbeat=60):
+                received[0] += 1
+                if received[0] >= expected:
+                    done.set()
+                    return
+
+    tasks = [asyncio.create_task(subscriber()) for _ in range(args.subscribers)]
+    await asyncio.sleep(0.1)
+
+    publish_time = 0.0
+    started = time.perf_counter()
+    for index in range(args.events):
+        tick = time.perf_counter()
+        hub.publish("order_status_changed", {"order_id": index, "status": "preparing", "previous_status": "pending"})
+        publish_time += time.perf_counter() - tick
+        if index % args.batch == args.batch - 1:
+            await asyncio.sleep(0)
+    await asyncio.wait_for(done.wait(), 120)
+    elapsed = time.perf_counter() - started
+    for task in tasks:
+        task.cancel()
+
+    print(f"subscribers={args.subscribers} events={args.events} deliveries={received[0]}")
+    print(f"publish: {publish_time / args.events * 1e6:.1f} us/event ({publish_time / expected * 1e9:.0f} ns per delivery)")
+    print(f"delivery throughput: {received[0] / elapsed:,.0f} events/s ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
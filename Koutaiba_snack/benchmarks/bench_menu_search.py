@@ -0,0 +1,104 @@
+"""
+Menu search micro-benchmark: in-process index vs the old `ilike` path.
+
+Builds a SearchIndex over a synthetic menu and times queries, including
+typos the `ilike '%q%'` path cannot match. As a baseline it times an
+in-process case-insensitive substring scan over item names, which is the
+best case for `ilike` before any network round trip. With --dsn it also
+times the real `ilike` query against the `items` table.
+
+Usage:
+    python -m benchmarks.bench_menu_search --items 500
+    python -m benchmarks.bench_menu_search --dsn postgresql://...
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from api.services.menu_search import SearchIndex
+
+WORDS = [
+    "cheese", "burger", "chicken", "spicy", "double", "beef", "crispy", "wrap", "fries", "cola",
+    "vanilla", "shake", "garlic", "sauce", "grilled", "falafel", "shawarma", "salad", "lemon", "mint",
+]
+CATEGORIES = ["Burgers", "Sandwiches", "Drinks", "Sides", "Desserts"]
+INGREDIENTS = ["bun", "cheddar", "lettuce", "tomato", "pickles", "onion", "potato", "milk", "ice", "tahini"]
+QUERIES = ["cheese", "chese", "burg", "spicy chicken", "garlik", "cola", "shawrma", "mint lemon", "fri", "tahini"]
+
+
+def synthetic_menu(count: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    documents = {}
+    for item_id in range(1, count + 1):
+        name = " ".join(rng.sample(WORDS, 2)).title()
+        documents[item_id] = {
+            "name": name,
+            "description": " ".join(rng.sample(WORDS, 5)),
+            "category": rng.choice(CATEGORIES),
+            "ingredients": " ".join(rng.sample(INGREDIENTS, 4)),
+        }
+    return documents
+
+
+def time_per_call(fn, queries, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for query in queries:
+            fn(query)
+    return (time.perf_counter() - started) / (rounds * len(queries)) * 1e6
+
+
+async def time_ilike(dsn: str, queries, rounds: int) -> float:
+    from api.database import db
+    await db.init_pool(dsn)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for query in queries:
+            await db.fetch("SELECT * FROM items WHERE name ILIKE $1 ORDER BY name", f"%{query}%")
+    elapsed = time.perf_counter() - started
+    await db.close_pool()
+    return elapsed / (rounds * len(queries)) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--dsn", default=None)
+    args = parser.parse_args()
+
+    documents = synthetic_menu(args.items, args.seed)
+    names = [(item_id, fields["name"].lower()) for item_id, fields in documents.items()]
+
+    started = time.perf_counter()
+    index = SearchIndex(cache_size=0)
+    index.update(documents)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    documents[1] = dict(documents[1], name="Chili Cheese Fries")
+    index.update(documents)
+    update_us = (time.perf_counter() - started) * 1e6
+
+    def substring_scan(query):
+        needle = query.lower()
+        return [item_id for item_id, name in names if needle in name]
+
+    cached = SearchIndex()
+    cached.update(documents)
+
+    print(f"items={args.items} build={build_ms:.1f}ms incremental update of one item={update_us:.0f}us")
+    print(f"{'query':<14}{'index hits':>11}{'ilike hits':>11}")
+    for query in QUERIES:
+        print(f"{query:<14}{len(index.search(query, 1000)):>11}{len(substring_scan(query)):>11}")
+    print(f"index search (uncached): {time_per_call(lambda q: index.search(q, 20), QUERIES, args.rounds):8.1f} us/query")
+    print(f"index search (cached):   {time_per_call(lambda q: cached.search(q, 20), QUERIES, args.rounds):8.1f} us/query")
+    print(f"in-process name scan:    {time_per_call(substring_scan, QUERIES, args.rounds):8.1f} us/query")
+    if args.dsn:
+        print(f"ilike over the network:  {asyncio.run(time_ilike(args.dsn, QUERIES, max(1, args.rounds // 10))):8.1f} us/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+A lunch-time spike of orders, placed synchronously and through the
+asynchronous intake queue (`Prefer: respond-async`).
+
+Fires --orders orders at once, --concurrency at a time, with carts drawn
+from a few popular items so they contend on the same ingredients, first as
+plain `POST /orders` and then as accept-fast ones. Reports the latency the
+clients saw, failed requests, and for the queued mode how long the workers
+took to create every order.
+
+Runs in-process against the embedded local Postgres (seeded like
+`benchmarks.load_api`) unless given a --dsn.
+
+Usage:
+    python -m benchmarks.bench_order_intake --orders 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import List
+
+import httpx
+
+from benchmarks.load_api import percentile, seed
+
+
+def carts(count: int, rng: random.Random) -> List[dict]:
+    popular = list(range(1, 11))
+    return [
+        {
+            "customer_name": f"Spike {n}",
+            "items": [{"item_id": item_id, "quantity": rng.randint(1, 2)} for item_id in rng.sample(popular, rng.randint(1, 3))],
+        }
+        for n in range(count)
+    ]
+
+
+async def spike(client: httpx.AsyncClient, orders: List[dict], concurrency: int, headers: dict) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def place(order: dict) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                status = (await client.post("/orders", json=order, headers=headers)).status_code
+            except Exception:
+                # Timeouts, or the app's own exception in-process (a 500 over HTTP).
+                status = "error"
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(place(order) for order in orders))
+    return {"elapsed": time.perf_counter() - started, "latencies": latencies, "statuses": statuses}
+
+
+def show(label: str, result: dict) -> None:
+    latencies = result["latencies"]
+    print(
+        f"{label:<8} {len(latencies) / result['elapsed']:8.0f} req/s"
+        f"  p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  p99 {percentile(latencies, 0.99) * 1000:7.1f} ms"
+        f"  statuses {dict(sorted(result['statuses'].items(), key=str))}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default="local://", help="database for the in-process app (default: embedded local Postgres)")
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.dsn
+    from api.database import db
+    from api.main import app
+    from api.services import order_intake
+
+    await db.init_pool()
+    if await seed(200, 60, 20000, args.seed):
+        print("seeded 200 items, 60 ingredients, 20000 orders")
+    rng = random.Random(args.seed)
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60) as client:
+            show("sync", await spike(client, carts(args.orders, rng), args.concurrency, {}))
+
+            first = await db.fetchval("SELECT COALESCE(MAX(id), 0) FROM order_intake")
+            result = await spike(client, carts(args.orders, rng), args.concurrency, {"Prefer": "respond-async"})
+            show("queued", result)
+            while await db.fetchval("SELECT EXISTS (SELECT 1 FROM order_intake WHERE id > $1 AND status = 'queued')", first):
+                await asyncio.sleep(0.05)
+            row = await db.fetchrow(
+                "SELECT count(*) FILTER (WHERE status = 'created') AS created, count(*) FILTER (WHERE status <> 'created') AS other, "
+                "EXTRACT(EPOCH FROM MAX(finished_at) - MIN(created_at)) AS seconds FROM order_intake WHERE id > $1",
+                first,
+            )
+            print(
+                f"workers  {order_intake.WORKERS} x batches of up to {order_intake.BATCH_SIZE}: "
+                f"{row['created']} created, {row['other']} not, all done {float(row['seconds']):.2f} s after the first was accepted"
+                f" ({row['created'] / float(row['seconds']):.0f} orders/s)"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
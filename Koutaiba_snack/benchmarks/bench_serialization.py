@@ -0,0 +1,120 @@
+"""
+Serialization micro-benchmark for large order lists.
+
+Compares the old response path (validate every row into a pydantic model,
+run jsonable_encoder, then render with the stdlib JSONResponse) against the
+current one (construct models without validation and serialize them in a
+single pass with `api.utils.responses.json_response`).
+
+The models below mirror the shape of `schemas.Order` / `schemas.OrderItem`
+so the benchmark runs without a database.
+
+Usage:
+    python -m benchmarks.bench_serialization --orders 5000 --repeat 5
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from api.utils.responses import json_response
+from api.utils.serialization import construct, orjson
+
+
+class OrderItem(BaseModel):
+    id: int
+    order_id: int
+    item_id: int
+    quantity: int
+    unit_price: float
+    notes: Optional[str] = None
+
+
+class Order(BaseModel):
+    id: int
+    customer_name: str
+    customer_phone: Optional[str] = None
+    table_number: Optional[int] = None
+    notes: Optional[str] = None
+    status: str
+    total_amount: float
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    items: Optional[List[OrderItem]] = None
+
+
+def synthetic_rows(count: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    rows = []
+    for order_id in range(1, count + 1):
+        items = [
+            {
+                "id": order_id * 10 + line,
+                "order_id": order_id,
+                "item_id": rng.randint(1, 40),
+                "quantity": rng.randint(1, 4),
+                "unit_price": Decimal(rng.randint(150, 1500)) / 100,
+                "notes": None,
+            }
+            for line in range(rng.randint(1, 5))
+        ]
+        rows.append({
+            "id": order_id,
+            "customer_name": f"Customer {rng.randint(1, 500)}",
+            "customer_phone": f"555-{rng.randint(0, 9999):04d}",
+            "table_number": rng.choice([None, rng.randint(1, 30)]),
+            "notes": None,
+            "status": rng.choice(["pending", "preparing", "ready", "completed"]),
+            "total_amount": sum(item["unit_price"] * item["quantity"] for item in items),
+            "created_at": now - timedelta(minutes=order_id),
+            "updated_at": None,
+            "items": items,
+        })
+    return rows
+
+
+def old_path(rows: List[dict]) -> bytes:
+    orders = [Order(**row) for row in rows]
+    content = {"success": True, "message": "Orders retrieved successfully", "data": jsonable_encoder(orders)}
+    return JSONResponse(content=content).body
+
+
+def new_path(rows: List[dict]) -> bytes:
+    orders = [construct(Order, row) for row in rows]
+    return json_response(data=orders, message="Orders retrieved successfully").body
+
+
+def timed(label: str, render, rows: List[dict], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = render(rows)
+        samples.append(time.perf_counter() - started)
+    best = min(samples)
+    print(f"{label:<44} best {best * 1000:8.1f} ms   {len(body) / 1024:8.1f} KiB")
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.orders, args.seed)
+    print(f"orders={args.orders} repeat={args.repeat} encoder={'orjson' if orjson is not None else 'json'}")
+    old = timed("validate + jsonable_encoder + JSONResponse", old_path, rows, args.repeat)
+    new = timed("construct + json_response", new_path, rows, args.repeat)
+    print(f"speedup: {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Startup cost of an API worker, i.e. what a rolling restart adds before the
+new worker serves at full speed.
+
+Measures, in order:
+  1. importing `api.main` in fresh interpreters (median of --runs), with
+     the slowest imports by cumulative time from `python -X importtime`;
+  2. the lifespan warm-up (pool, menu snapshot, recipe matrix, revenue and
+     popularity counters) after the database is up;
+  3. the latency of the first requests to the hot endpoints, which the
+     warm-up should make as fast as the ones after them.
+
+Runs against the embedded local Postgres unless given a --dsn.
+
+Usage:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --dsn postgresql://... --runs 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+import httpx
+
+HOT_PATHS = ["/menu", "/menu/categories", "/menu/available", "/ingredients/low-stock", "/stock/max-makeable"]
+
+
+def import_once() -> Tuple[float, List[Tuple[int, str]]]:
+    """Imports api.main in a fresh interpreter; returns wall time and (cumulative us, module) for every import."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import api.main"],
+        capture_output=True, text=True, env=os.environ.copy(),
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise SystemExit(result.stderr.strip().splitlines()[-1])
+    timings = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            timings.append((int(cumulative), name.rstrip()))
+    return elapsed, timings
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default="local://", help="database to warm up against (default: embedded local Postgres)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time the import in")
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    args = parser.parse_args()
+    os.environ["DATABASE_URL"] = args.dsn
+
+    runs = [import_once() for _ in range(args.runs)]
+    print(f"import api.main: {statistics.median(elapsed for elapsed, _ in runs) * 1000:.0f} ms (median of {args.runs}, incl. interpreter start)")
+    # The direct imports of api.main, from the last run. -X importtime lists
+    # children before their parent, indented by two spaces per level.
+    children, top = [], []
+    for us, name in runs[-1][1]:
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == "api.main":
+                top = children
+            children = []
+        elif depth == 1:
+            children.append((us, name.strip()))
+    for us, name in sorted(top, reverse=True)[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    from api.database import db
+    from api.main import app
+
+    started = time.perf_counter()
+    await db.init_pool()
+    print(f"database up: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    lifespan = app.router.lifespan_context(app)
+    started = time.perf_counter()
+    await lifespan.__aenter__()
+    print(f"lifespan warm-up: {(time.perf_counter() - started) * 1000:.0f} ms")
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            print(f"/ready: {(await client.get('/ready')).status_code}")
+            for path in HOT_PATHS:
+                latencies = []
+                for _ in range(2):
+                    tick = time.perf_counter()
+                    response = await client.get(path)
+                    latencies.append((time.perf_counter() - tick) * 1000)
+                print(f"  {path:<24} first {latencies[0]:7.2f} ms  second {latencies[1]:7.2f} ms  ({response.status_code})")
+    finally:
+        await lifespan.__aexit__(None, None, None)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
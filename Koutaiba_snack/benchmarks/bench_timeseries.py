@@ -0,0 +1,94 @@
+"""
+Latency of `/analytics/timeseries` over a year of orders.
+
+Fills a throwaway `bench_timeseries` schema with --orders orders spread over
+the last --days days (busier at lunch and dinner), loads the columnar order
+snapshot once, then times hourly and daily series over the whole range and
+over its last week, in UTC and in a DST-observing time zone. Each timing
+covers bucketing and serializing every chunk, i.e. the work of one request
+once the snapshot is loaded; median of --repeat runs.
+
+Runs against the embedded local Postgres unless given a --dsn.
+
+Usage:
+    python -m benchmarks.bench_timeseries --orders 500000 --days 365
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from api.database import db
+from api.services import order_timeseries
+from api.utils.serialization import dumps
+
+SCHEMA = "bench_timeseries"
+
+
+async def setup(orders: int, days: int) -> None:
+    async with db.connection() as conn:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        await conn.execute(
+            f"CREATE TABLE {SCHEMA}.orders (id serial PRIMARY KEY, status text NOT NULL DEFAULT 'completed', "
+            "total_amount numeric(10, 2), created_at timestamptz NOT NULL)"
+        )
+        await conn.execute(f"CREATE INDEX ON {SCHEMA}.orders (created_at, id)")
+        # Mostly around 12:30 and 19:30 UTC, the rest anywhere in the day; 2% cancelled.
+        await conn.execute(
+            f"INSERT INTO {SCHEMA}.orders (status, total_amount, created_at) "
+            "SELECT CASE WHEN random() < 0.02 THEN 'cancelled' ELSE 'completed' END, round((5 + random() * 40)::numeric, 2), "
+            "date_trunc('day', now()) - make_interval(days => floor(random() * $2)::int) "
+            "+ make_interval(secs => CASE WHEN random() < 0.7 "
+            "THEN (CASE WHEN random() < 0.6 THEN 45000 ELSE 70200 END) + (random() - 0.5) * 7200 ELSE random() * 86400 END) "
+            "FROM generate_series(1, $1)",
+            orders, days,
+        )
+        await conn.execute(f"ANALYZE {SCHEMA}.orders")
+
+
+async def time_series(start: datetime, end: datetime, interval: str, tz, repeat: int) -> tuple:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        buckets, meta = await order_timeseries.get_timeseries(start, end, interval, tz)
+        size = sum(len(dumps(chunk)) for chunk in buckets) + len(dumps(meta))
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), meta["buckets"], size
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL") or "local://")
+    parser.add_argument("--orders", type=int, default=500000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    await db.init_pool(args.dsn, server_settings={"search_path": SCHEMA})
+    started = time.perf_counter()
+    await setup(args.orders, args.days)
+    print(f"inserted {args.orders} orders over {args.days} days: {time.perf_counter() - started:.1f} s")
+
+    started = time.perf_counter()
+    columns = await order_timeseries.get_columns()
+    print(f"snapshot load: {(time.perf_counter() - started) * 1000:.0f} ms for {len(columns)} orders "
+          f"({sum(column.nbytes for column in (columns.ids, columns.created, columns.cents, columns.cumulative)) / 1e6:.1f} MB)")
+
+    end = datetime.now(timezone.utc)
+    ranges = [("whole range", end - timedelta(days=args.days)), ("last week", end - timedelta(days=7))]
+    for zone in ("UTC", "Europe/Paris"):
+        tz = order_timeseries.parse_timezone(zone)
+        for label, start in ranges:
+            for interval in order_timeseries.INTERVALS:
+                elapsed, buckets, size = await time_series(start, end, interval, tz, args.repeat)
+                print(f"  {zone:<13} {label:<12} {interval:<5} {buckets:>6} buckets  {elapsed:7.2f} ms  {size / 1024:7.0f} KiB")
+
+    await db.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,259 @@
+"""
+API load test: drives the FastAPI app with a realistic request mix and
+reports throughput and p50/p99 latency per endpoint.
+
+By default everything runs offline in one process: the app is served over an
+in-memory ASGI transport, backed by the embedded local Postgres
+(DATABASE_URL=local://) seeded with a synthetic menu, stock and order
+history. Point --dsn at another database to use it instead (it is only
+seeded when its `items` table is empty), or --base-url at a running server
+to load it over HTTP.
+
+Mixes:
+    mixed      menu browsing, order taking and the analytics dashboard together
+    menu       read-only menu traffic (full menu, items, search, availability)
+    orders     order taking: create, look up, list and advance orders
+    analytics  the back-office dashboard endpoints
+
+Usage:
+    python -m benchmarks.load_api --mix mixed --requests 5000 --concurrency 32
+    python -m benchmarks.load_api --mix orders --duration 30 --json results.json
+    python -m benchmarks.load_api --base-url http://localhost:8000 --mix menu
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+WORDS = [
+    "cheese", "burger", "chicken", "spicy", "double", "beef", "crispy", "wrap", "fries", "cola",
+    "vanilla", "shake", "garlic", "sauce", "grilled", "falafel", "shawarma", "salad", "lemon", "mint",
+]
+CATEGORIES = ["Burgers", "Sandwiches", "Drinks", "Sides", "Desserts"]
+SEARCHES = ["cheese", "chese", "burg", "spicy chicken", "garlik", "cola", "shawrma", "mint lemon", "fri"]
+STATUSES = ["preparing", "ready", "completed"]
+
+
+async def seed(items: int, ingredients: int, history: int, seed: int) -> bool:
+    """Fills an empty database with a synthetic menu, recipes and order history."""
+    from api.database import db
+
+    if await db.fetchval("SELECT EXISTS (SELECT 1 FROM items)"):
+        return False
+    rng = random.Random(seed)
+    async with db.transaction() as conn:
+        rows, args = db.values_rows([(name, f"{name} items") for name in CATEGORIES])
+        await conn.execute(f"INSERT INTO categories (name, description) VALUES {rows}", *args)
+        rows, args = db.values_rows(
+            [(f"Ingredient {n}", "pcs", 10_000_000, 100) for n in range(1, ingredients + 1)]
+        )
+        await conn.execute(f"INSERT INTO ingredients (name, unit, current_stock, min_stock_level) VALUES {rows}", *args)
+        rows, args = db.values_rows([
+            (
+                " ".join(rng.sample(WORDS, 2)).title(),
+                " ".join(rng.sample(WORDS, 6)),
+                rng.randint(150, 1500) / 100,
+                rng.randint(1, len(CATEGORIES)),
+                rng.random() > 0.1,
+            )
+            for _ in range(items)
+        ])
+        await conn.execute(f"INSERT INTO items (name, description, price, category_id, available) VALUES {rows}", *args)
+        recipes = [
+            (item_id, ingredient_id, rng.randint(1, 3))
+            for item_id in range(1, items + 1)
+            for ingredient_id in rng.sample(range(1, ingredients + 1), min(ingredients, rng.randint(2, 6)))
+        ]
+        rows, args = db.values_rows(recipes)
+        await conn.execute(f"INSERT INTO item_ingredients (item_id, ingredient_id, quantity_required) VALUES {rows}", *args)
+        # Order history over the last 60 days, with a few hundred repeat customers.
+        await conn.execute(
+            "INSERT INTO orders (customer_name, customer_phone, status, total_amount, created_at) "
+            "SELECT 'Customer ' || (n % 400), '555-' || lpad((n % 400)::text, 4, '0'), "
+            "(ARRAY['pending', 'preparing', 'ready', 'completed', 'completed', 'cancelled'])[1 + n % 6], "
+            "round((5 + random() * 40)::numeric, 2), now() - random() * interval '60 days' "
+            "FROM generate_series(1, $1) AS n",
+            history,
+        )
+        await conn.execute(
+            "INSERT INTO order_items (order_id, item_id, quantity, unit_price) "
+            "SELECT o.id, 1 + ((o.id * 7 + k * 13) % $1), 1 + (o.id + k) % 3, 5 "
+            "FROM orders o CROSS JOIN generate_series(1, 1 + o.id % 3) AS k",
+            items,
+        )
+    return True
+
+
+class Workload:
+    """Request factories for one mix, picked at random by weight."""
+
+    def __init__(self, mix: str, item_ids: List[int], rng: random.Random):
+        self.item_ids = item_ids
+        self.rng = rng
+        self.order_ids: List[int] = []
+        menu = [
+            (8, "GET /menu", lambda: ("GET", "/menu", None)),
+            (3, "GET /menu/categories", lambda: ("GET", "/menu/categories", None)),
+            (10, "GET /menu/items/{id}", lambda: ("GET", f"/menu/items/{self.rng.choice(self.item_ids)}", None)),
+            (6, "GET /menu/search", lambda: ("GET", f"/menu/search?q={self.rng.choice(SEARCHES)}", None)),
+            (4, "GET /menu/available", lambda: ("GET", "/menu/available", None)),
+            (2, "GET /menu/categories/{name}", lambda: ("GET", f"/menu/categories/{self.rng.choice(CATEGORIES)}", None)),
+        ]
+        orders = [
+            (6, "POST /orders", self.new_order),
+            (4, "GET /orders/{id}", lambda: ("GET", f"/orders/{self.known_order()}", None)),
+            (2, "GET /orders?limit=50", lambda: ("GET", "/orders?limit=50", None)),
+            (3, "PUT /orders/{id}/status", lambda: ("PUT", f"/orders/{self.known_order()}/status", {"status": self.rng.choice(STATUSES)})),
+        ]
+        analytics = [
+            (3, "GET /analytics/revenue", lambda: ("GET", "/analytics/revenue", None)),
+            (3, "GET /analytics/popular-items", lambda: ("GET", "/analytics/popular-items", None)),
+            (2, "GET /customers", lambda: ("GET", "/customers?limit=50", None)),
+            (2, "GET /ingredients/low-stock", lambda: ("GET", "/ingredients/low-stock", None)),
+            (1, "GET /ingredients", lambda: ("GET", "/ingredients?limit=50", None)),
+        ]
+        self.operations = {"menu": menu, "orders": orders, "analytics": analytics, "mixed": menu + orders + analytics}[mix]
+        self.weights = [weight for weight, _, _ in self.operations]
+
+    def new_order(self) -> tuple:
+        lines = [
+            {"item_id": item_id, "quantity": self.rng.randint(1, 3)}
+            for item_id in self.rng.sample(self.item_ids, min(len(self.item_ids), self.rng.randint(1, 3)))
+        ]
+        customer = self.rng.randint(1, 400)
+        body = {"customer_name": f"Customer {customer}", "customer_phone": f"555-{customer:04d}", "items": lines}
+        return "POST", "/orders", body
+
+    def known_order(self) -> int:
+        return self.rng.choice(self.order_ids) if self.order_ids else 1
+
+    def next(self) -> Tuple[str, Callable]:
+        _, label, factory = self.rng.choices(self.operations, self.weights)[0]
+        return label, factory
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_load(client: httpx.AsyncClient, workload: Workload, requests: int, duration: float, concurrency: int):
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    remaining = [requests]
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker():
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+            elif remaining[0] <= 0:
+                return
+            else:
+                remaining[0] -= 1
+            label, factory = workload.next()
+            method, path, body = factory()
+            started = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            latencies[label].append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors[label] += 1
+            elif method == "POST" and response.status_code == 201:
+                workload.order_ids.append(response.json()["data"]["id"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def report(latencies: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> dict:
+    total = sum(len(samples) for samples in latencies.values())
+    results = {
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "endpoints": {},
+    }
+    print(f"{'endpoint':<30} {'count':>7} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for label in sorted(latencies):
+        samples = latencies[label]
+        row = {
+            "count": len(samples),
+            "errors": errors.get(label, 0),
+            "rps": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+        }
+        results["endpoints"][label] = row
+        print(f"{label:<30} {row['count']:>7} {row['errors']:>6} {row['rps']:>8} {row['p50_ms']:>8} {row['p99_ms']:>8}")
+    print(f"total: {total} requests in {elapsed:.2f}s = {results['throughput_rps']} req/s")
+    return results
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", choices=["mixed", "menu", "orders", "analytics"], default="mixed")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=0, help="run for this many seconds instead of --requests")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--dsn", default="local://", help="database for the in-process app (default: embedded local Postgres)")
+    parser.add_argument("--base-url", help="load a running server over HTTP instead of the in-process app")
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--ingredients", type=int, default=60)
+    parser.add_argument("--history", type=int, default=20000, help="historical orders to seed")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=30)
+        lifespan = None
+    else:
+        os.environ["DATABASE_URL"] = args.dsn
+        from api.database import db
+        from api.main import app
+
+        await db.init_pool()
+        if await seed(args.items, args.ingredients, args.history, args.seed):
+            print(f"seeded {args.items} items, {args.ingredients} ingredients, {args.history} orders")
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=30)
+        lifespan = app.router.lifespan_context(app)
+
+    async with client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            menu = (await client.get("/menu/available")).json()["data"]
+            workload = Workload(args.mix, [item["id"] for item in menu], rng)
+            # Warm up caches and counters so the first requests don't skew the percentiles.
+            for _ in range(min(50, args.concurrency * 2)):
+                _, factory = workload.next()
+                method, path, body = factory()
+                await client.request(method, path, json=body)
+            print(f"mix={args.mix} concurrency={args.concurrency} " + (f"duration={args.duration}s" if args.duration else f"requests={args.requests}"))
+            latencies, errors, elapsed = await run_load(client, workload, args.requests, args.duration, args.concurrency)
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    results = report(latencies, errors, elapsed)
+    results.update(mix=args.mix, concurrency=args.concurrency)
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(results, handle, indent=2)
+    return 1 if any(errors.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
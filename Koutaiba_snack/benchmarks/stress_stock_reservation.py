@@ -0,0 +1,114 @@
+"""
+Concurrency stress test for the stock reservation engine.
+
+Fires many concurrent orders at a few shared ingredients through
+`api.services.stock_reservation.reserve`, then checks that:
+
+- no ingredient went below zero (no overselling);
+- every ingredient's final stock equals its starting stock minus exactly the
+  demand of the accepted orders (no lost decrements);
+- every rejected order left no partial decrement behind.
+
+Runs against a throwaway `stress_stock` schema on the Postgres given by --dsn
+or DATABASE_URL, and reports orders per second. Without either it uses the
+embedded local Postgres (`local://`), so it also runs offline.
+
+Usage:
+    python -m benchmarks.stress_stock_reservation --orders 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+from api.database import db
+from api.services import stock_reservation
+
+SCHEMA = "stress_stock"
+
+
+async def setup(ingredients: int, stock: float) -> None:
+    async with db.connection() as conn:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        await conn.execute(
+            f"CREATE TABLE {SCHEMA}.ingredients (id int PRIMARY KEY, name text NOT NULL, "
+            "unit text, current_stock numeric NOT NULL, min_stock_level numeric NOT NULL DEFAULT 0)"
+        )
+        for ingredient_id in range(1, ingredients + 1):
+            await conn.execute(
+                f"INSERT INTO {SCHEMA}.ingredients (id, name, current_stock) VALUES ($1, $2, $3)",
+                ingredient_id, f"ingredient-{ingredient_id}", stock,
+            )
+
+
+async def place_order(demand: dict) -> bool:
+    try:
+        async with db.transaction() as conn:
+            await stock_reservation.reserve(conn, demand)
+        return True
+    except stock_reservation.InsufficientStockError:
+        return False
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL") or "local://")
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--ingredients", type=int, default=5)
+    parser.add_argument("--stock", type=float, default=3000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DB_POOL_MAX_SIZE", str(min(args.concurrency, 20)))
+    await db.init_pool(args.dsn, server_settings={"search_path": SCHEMA})
+    await setup(args.ingredients, args.stock)
+
+    rng = random.Random(args.seed)
+    orders = []
+    for _ in range(args.orders):
+        chosen = rng.sample(range(1, args.ingredients + 1), rng.randint(1, args.ingredients))
+        orders.append({ingredient_id: rng.randint(1, 4) for ingredient_id in chosen})
+
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def run(demand):
+        async with gate:
+            return await place_order(demand)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run(demand) for demand in orders))
+    elapsed = time.perf_counter() - started
+
+    expected = {ingredient_id: args.stock for ingredient_id in range(1, args.ingredients + 1)}
+    for demand, accepted in zip(orders, results):
+        if accepted:
+            for ingredient_id, quantity in demand.items():
+                expected[ingredient_id] -= quantity
+
+    rows = await db.fetch("SELECT id, current_stock FROM ingredients ORDER BY id")
+    failures = []
+    for row in rows:
+        actual = float(row['current_stock'])
+        if actual < 0:
+            failures.append(f"ingredient {row['id']} oversold: {actual}")
+        if actual != expected[row['id']]:
+            failures.append(f"ingredient {row['id']} lost updates: expected {expected[row['id']]}, got {actual}")
+
+    await db.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    await db.close_pool()
+
+    accepted = sum(results)
+    print(f"orders={args.orders} accepted={accepted} rejected={args.orders - accepted} concurrency={args.concurrency}")
+    print(f"throughput: {args.orders / elapsed:.1f} orders/s ({elapsed:.2f}s)")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print("OK: no lost updates, no overselling" if not failures else f"{len(failures)} consistency failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,54 @@
+-- The tables the services read and write. They already exist on the Supabase
+-- project, so this is a no-op there; it creates them on a fresh database such
+-- as the local stand-in used for benchmarks (DATABASE_URL=local://).
+
+CREATE TABLE IF NOT EXISTS categories (
+    id          serial PRIMARY KEY,
+    name        text NOT NULL UNIQUE,
+    description text
+);
+
+CREATE TABLE IF NOT EXISTS items (
+    id          serial PRIMARY KEY,
+    name        text NOT NULL,
+    description text,
+    price       numeric(10, 2) NOT NULL,
+    category_id int REFERENCES categories (id),
+    available   boolean NOT NULL DEFAULT true
+);
+
+CREATE TABLE IF NOT EXISTS ingredients (
+    id              serial PRIMARY KEY,
+    name            text NOT NULL,
+    unit            text,
+    current_stock   numeric NOT NULL DEFAULT 0,
+    min_stock_level numeric NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS item_ingredients (
+    item_id           int NOT NULL REFERENCES items (id),
+    ingredient_id     int NOT NULL REFERENCES ingredients (id),
+    quantity_required numeric NOT NULL,
+    PRIMARY KEY (item_id, ingredient_id)
+);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id             serial PRIMARY KEY,
+    customer_name  text NOT NULL,
+    customer_phone text,
+    table_number   int,
+    notes          text,
+    status         text NOT NULL DEFAULT 'pending',
+    total_amount   numeric(10, 2) DEFAULT 0,
+    created_at     timestamptz NOT NULL DEFAULT now(),
+    updated_at     timestamptz
+);
+
+CREATE TABLE IF NOT EXISTS order_items (
+    id         serial PRIMARY KEY,
+    order_id   int NOT NULL REFERENCES orders (id),
+    item_id    int NOT NULL REFERENCES items (id),
+    quantity   int NOT NULL,
+    unit_price numeric(10, 2) NOT NULL,
+    notes      text
+);
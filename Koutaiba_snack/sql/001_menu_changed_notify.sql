@@ -0,0 +1,20 @@
+-- Tells running API workers to drop their cached menu snapshot whenever the
+-- menu is edited, including edits made from the Supabase dashboard.
+-- Workers LISTEN on the `menu_changed` channel (see api/main.py).
+
+CREATE OR REPLACE FUNCTION notify_menu_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('menu_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS items_menu_changed ON items;
+CREATE TRIGGER items_menu_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON items
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_menu_changed();
+
+DROP TRIGGER IF EXISTS categories_menu_changed ON categories;
+CREATE TRIGGER categories_menu_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categories
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_menu_changed();
@@ -0,0 +1,13 @@
+-- The menu search index also covers ingredient names, so recipe changes and
+-- ingredient renames must refresh the menu snapshot too. Stock updates do
+-- not touch `name` and therefore do not fire this trigger.
+
+DROP TRIGGER IF EXISTS item_ingredients_menu_changed ON item_ingredients;
+CREATE TRIGGER item_ingredients_menu_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON item_ingredients
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_menu_changed();
+
+DROP TRIGGER IF EXISTS ingredients_renamed_menu_changed ON ingredients;
+CREATE TRIGGER ingredients_renamed_menu_changed
+    AFTER UPDATE OF name ON ingredients
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_menu_changed();
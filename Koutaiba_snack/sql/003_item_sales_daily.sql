@@ -0,0 +1,43 @@
+-- Per-item, per-day sales rollup behind /analytics/popular-items.
+-- Kept up to date by a statement-level trigger on order_items, so a whole
+-- multi-line order is folded in with one set-based upsert, and backfilled
+-- from the existing order history below. Order inserts are blocked while
+-- this runs, so no line is missed or counted twice.
+
+BEGIN;
+LOCK TABLE order_items IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TABLE IF NOT EXISTS item_sales_daily (
+    item_id  int    NOT NULL,
+    day      date   NOT NULL,
+    quantity bigint NOT NULL DEFAULT 0,
+    lines    bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (item_id, day)
+);
+
+CREATE OR REPLACE FUNCTION rollup_item_sales() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO item_sales_daily (item_id, day, quantity, lines)
+    SELECT n.item_id, (o.created_at AT TIME ZONE 'UTC')::date, SUM(n.quantity), COUNT(*)
+    FROM new_lines n JOIN orders o ON o.id = n.order_id
+    GROUP BY 1, 2
+    ON CONFLICT (item_id, day) DO UPDATE
+        SET quantity = item_sales_daily.quantity + EXCLUDED.quantity,
+            lines = item_sales_daily.lines + EXCLUDED.lines;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS order_items_rollup ON order_items;
+CREATE TRIGGER order_items_rollup
+    AFTER INSERT ON order_items
+    REFERENCING NEW TABLE AS new_lines
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_item_sales();
+
+TRUNCATE item_sales_daily;
+INSERT INTO item_sales_daily (item_id, day, quantity, lines)
+SELECT oi.item_id, (o.created_at AT TIME ZONE 'UTC')::date, SUM(oi.quantity), COUNT(*)
+FROM order_items oi JOIN orders o ON o.id = oi.order_id
+GROUP BY 1, 2;
+
+COMMIT;
@@ -0,0 +1,63 @@
+-- One row per customer behind /customers, instead of one per order.
+-- Customers are keyed by their phone number reduced to digits, the same rule
+-- as the agent's utils.format_phone_number; orders without a usable phone
+-- fall back to the lowercased name. A statement-level trigger on orders keeps
+-- the directory current, and it is backfilled from history below.
+
+BEGIN;
+LOCK TABLE orders IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE OR REPLACE FUNCTION normalize_phone(phone text) RETURNS text AS $$
+    SELECT regexp_replace(coalesce(phone, ''), '\D', '', 'g');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION customer_key(name text, phone text) RETURNS text AS $$
+    SELECT CASE WHEN normalize_phone(phone) <> '' THEN normalize_phone(phone)
+                ELSE 'name:' || lower(trim(coalesce(name, ''))) END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS customer_directory (
+    customer_key   text        PRIMARY KEY,
+    customer_name  text        NOT NULL,
+    customer_phone text,
+    order_count    bigint      NOT NULL DEFAULT 0,
+    first_order_at timestamptz NOT NULL,
+    last_order_at  timestamptz NOT NULL
+);
+CREATE INDEX IF NOT EXISTS customer_directory_recent_idx ON customer_directory (last_order_at, customer_key);
+
+CREATE OR REPLACE FUNCTION rollup_customers() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO customer_directory AS d (customer_key, customer_name, customer_phone, order_count, first_order_at, last_order_at)
+    SELECT DISTINCT ON (customer_key(customer_name, customer_phone))
+           customer_key(customer_name, customer_phone), customer_name, customer_phone,
+           COUNT(*) OVER w, MIN(created_at) OVER w, MAX(created_at) OVER w
+    FROM new_orders
+    WINDOW w AS (PARTITION BY customer_key(customer_name, customer_phone))
+    ORDER BY customer_key(customer_name, customer_phone), created_at DESC
+    ON CONFLICT (customer_key) DO UPDATE
+        SET customer_name = EXCLUDED.customer_name,
+            customer_phone = EXCLUDED.customer_phone,
+            order_count = d.order_count + EXCLUDED.order_count,
+            first_order_at = LEAST(d.first_order_at, EXCLUDED.first_order_at),
+            last_order_at = GREATEST(d.last_order_at, EXCLUDED.last_order_at);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS orders_customer_directory ON orders;
+CREATE TRIGGER orders_customer_directory
+    AFTER INSERT ON orders
+    REFERENCING NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION rollup_customers();
+
+TRUNCATE customer_directory;
+INSERT INTO customer_directory (customer_key, customer_name, customer_phone, order_count, first_order_at, last_order_at)
+SELECT DISTINCT ON (customer_key(customer_name, customer_phone))
+       customer_key(customer_name, customer_phone), customer_name, customer_phone,
+       COUNT(*) OVER w, MIN(created_at) OVER w, MAX(created_at) OVER w
+FROM orders
+WINDOW w AS (PARTITION BY customer_key(customer_name, customer_phone))
+ORDER BY customer_key(customer_name, customer_phone), created_at DESC;
+
+COMMIT;
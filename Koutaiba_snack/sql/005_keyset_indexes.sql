@@ -0,0 +1,6 @@
+-- Indexes matching the keyset (cursor) pagination order of the list
+-- endpoints, so every page is an index range scan of `limit` rows.
+
+CREATE INDEX IF NOT EXISTS orders_created_at_id_idx ON orders (created_at, id);
+CREATE INDEX IF NOT EXISTS orders_status_created_at_id_idx ON orders (status, created_at, id);
+CREATE INDEX IF NOT EXISTS ingredients_name_id_idx ON ingredients (name, id);
@@ -0,0 +1,27 @@
+-- Tells running API workers about stock level changes, so the in-memory
+-- recipe matrix behind /stock/check-cart and /stock/max-makeable follows
+-- orders and deliveries taken by other workers or the Supabase dashboard.
+-- The payload lists the changed "id:stock" pairs; when they don't fit in a
+-- notification it is empty, and workers reload all stock levels instead.
+
+CREATE OR REPLACE FUNCTION notify_stock_changed() RETURNS trigger AS $$
+DECLARE
+    changes text;
+BEGIN
+    SELECT string_agg(n.id || ':' || n.current_stock, ',') INTO changes
+    FROM new_rows n JOIN old_rows o ON o.id = n.id
+    WHERE n.current_stock IS DISTINCT FROM o.current_stock;
+    IF changes IS NOT NULL THEN
+        PERFORM pg_notify('stock_changed', CASE WHEN length(changes) > 7900 THEN '' ELSE changes END);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables can't be combined with a column list (UPDATE OF
+-- current_stock), so the function filters out rows whose stock is unchanged.
+DROP TRIGGER IF EXISTS ingredients_stock_changed ON ingredients;
+CREATE TRIGGER ingredients_stock_changed
+    AFTER UPDATE ON ingredients
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_stock_changed();
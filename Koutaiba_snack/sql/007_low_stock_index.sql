@@ -0,0 +1,5 @@
+-- Lets /ingredients/low-stock read just the ingredients at or below their
+-- minimum level, in name order, instead of scanning the whole table.
+
+CREATE INDEX IF NOT EXISTS ingredients_low_stock_idx ON ingredients (name)
+    WHERE current_stock <= min_stock_level;
@@ -0,0 +1,14 @@
+-- Order lifecycle events behind GET /orders/stream. Every order creation and
+-- status change appends a row here and is pushed to all workers through the
+-- `order_events` NOTIFY channel; `seq` is the event id clients resume from
+-- after a reconnect. Old events are pruned on startup.
+
+CREATE TABLE IF NOT EXISTS order_events (
+    seq        bigserial PRIMARY KEY,
+    event      text NOT NULL,
+    order_id   int NOT NULL,
+    payload    jsonb NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS order_events_created_at_idx ON order_events (created_at);
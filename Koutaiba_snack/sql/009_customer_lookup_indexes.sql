@@ -0,0 +1,16 @@
+-- Indexes for looking up a customer's order history by phone or name, newest
+-- first, instead of scanning every order with ILIKE '%name%'.
+-- Phones are reduced to digits with normalize_phone (004_customer_directory.sql),
+-- names are trimmed, lowercased and have their inner whitespace collapsed.
+-- The Python side applies the same rules in api.utils.normalize.
+
+CREATE OR REPLACE FUNCTION normalize_name(name text) RETURNS text AS $$
+    SELECT lower(trim(regexp_replace(coalesce(name, ''), '\s+', ' ', 'g')));
+$$ LANGUAGE sql IMMUTABLE;
+
+-- text_pattern_ops serves both the exact lookups and the prefix ones, which
+-- the API runs as ~>=~ / ~<~ ranges.
+CREATE INDEX IF NOT EXISTS orders_customer_phone_idx
+    ON orders (normalize_phone(customer_phone) text_pattern_ops, created_at, id);
+CREATE INDEX IF NOT EXISTS orders_customer_name_idx
+    ON orders (normalize_name(customer_name) text_pattern_ops, created_at, id);
@@ -0,0 +1,19 @@
+-- Durable queue behind `POST /orders` with `Prefer: respond-async`. An
+-- accepted order waits here as `queued` until a fulfilment worker claims it
+-- (FOR UPDATE SKIP LOCKED, inside the transaction that creates the order),
+-- then becomes `created` with its order_id or `rejected`/`failed` with the
+-- reason. A worker that dies mid-batch rolls back, so its orders are simply
+-- claimed again. Finished entries are pruned on startup.
+
+CREATE TABLE IF NOT EXISTS order_intake (
+    id          bigserial PRIMARY KEY,
+    payload     jsonb NOT NULL,
+    status      text NOT NULL DEFAULT 'queued',
+    order_id    int REFERENCES orders (id),
+    error       text,
+    created_at  timestamptz NOT NULL DEFAULT now(),
+    finished_at timestamptz
+);
+
+-- Workers claim the oldest queued entries; keeps that scan off finished ones.
+CREATE INDEX IF NOT EXISTS order_intake_queued_idx ON order_intake (id) WHERE status = 'queued';
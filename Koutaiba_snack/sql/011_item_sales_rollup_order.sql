@@ -0,0 +1,17 @@
+-- Upsert the item_sales_daily rollup in key order, so concurrent multi-item
+-- orders sharing items lock its rows in the same order and can't deadlock.
+-- Only the trigger function changes; the rollup rows are left as they are.
+
+CREATE OR REPLACE FUNCTION rollup_item_sales() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO item_sales_daily (item_id, day, quantity, lines)
+    SELECT n.item_id, (o.created_at AT TIME ZONE 'UTC')::date, SUM(n.quantity), COUNT(*)
+    FROM new_lines n JOIN orders o ON o.id = n.order_id
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (item_id, day) DO UPDATE
+        SET quantity = item_sales_daily.quantity + EXCLUDED.quantity,
+            lines = item_sales_daily.lines + EXCLUDED.lines;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,24 @@
+-- Customers without a usable phone are keyed by normalize_name
+-- (009_customer_lookup_indexes.sql), so "Ali  Baba" and "Ali Baba" are one
+-- customer in /customers as they are in the order history lookups. The
+-- directory is rebuilt under the new keys; order inserts are blocked while
+-- this runs, so no order is missed or counted twice.
+
+BEGIN;
+LOCK TABLE orders IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE OR REPLACE FUNCTION customer_key(name text, phone text) RETURNS text AS $$
+    SELECT CASE WHEN normalize_phone(phone) <> '' THEN normalize_phone(phone)
+                ELSE 'name:' || normalize_name(name) END;
+$$ LANGUAGE sql IMMUTABLE;
+
+TRUNCATE customer_directory;
+INSERT INTO customer_directory (customer_key, customer_name, customer_phone, order_count, first_order_at, last_order_at)
+SELECT DISTINCT ON (customer_key(customer_name, customer_phone))
+       customer_key(customer_name, customer_phone), customer_name, customer_phone,
+       COUNT(*) OVER w, MIN(created_at) OVER w, MAX(created_at) OVER w
+FROM orders
+WINDOW w AS (PARTITION BY customer_key(customer_name, customer_phone))
+ORDER BY customer_key(customer_name, customer_phone), created_at DESC;
+
+COMMIT;
@@ -0,0 +1,7 @@
+-- The open orders, newest first, for the snapshot an unfiltered /orders/stream
+-- subscriber starts with. They are a small, recent slice of the table, so
+-- without this the snapshot would walk back through every finished order.
+-- The status list is order_service.FINAL_STATUSES.
+
+CREATE INDEX IF NOT EXISTS orders_open_idx ON orders (created_at, id)
+    WHERE status NOT IN ('completed', 'cancelled', 'canceled');
@@ -3,11 +3,15 @@ Restaurant API Tools for LangChain Agent
 """
 import requests
 import json
+import uuid
 from typing import Optional, Dict, Any
 from langchain.tools import Tool
 from pydantic import BaseModel, Field
+from utils import format_phone_number, validate_phone_number
 
 BASE_URL = "http://127.0.0.1:8000"
+ORDER_TIMEOUT = 10
+ORDER_ATTEMPTS = 3
 
 # Pydantic models for structured inputs
 class OrderItem(BaseModel):
@@ -43,7 +47,7 @@ class CheckStockInput(BaseModel):
 
 class CustomerNameInput(BaseModel):
     """Input for customer search"""
-    customer_name: str = Field(description="Customer's name to search orders")
+    customer_name: str = Field(description="Customer's phone number or full name to search orders")
 
 # API Functions
 def get_complete_menu(input_data=None) -> str:
@@ -146,7 +150,16 @@ def create_order(customer_name: str, customer_phone: str, items_json: str,
             "items": items
         }
 
-        response = requests.post(f"{BASE_URL}/orders", json=order_data)
+        # Every attempt carries the same key, so a retry after a timeout
+        # returns the order the API already created instead of a duplicate.
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        for attempt in range(ORDER_ATTEMPTS):
+            try:
+                response = requests.post(f"{BASE_URL}/orders", json=order_data, headers=headers, timeout=ORDER_TIMEOUT)
+                break
+            except (requests.Timeout, requests.ConnectionError):
+                if attempt == ORDER_ATTEMPTS - 1:
+                    raise
         response.raise_for_status()
         return json.dumps(response.json(), indent=2)
     except json.JSONDecodeError:
@@ -165,9 +178,16 @@ def create_order_wrapper(data: Dict[str, Any]) -> str:
     )
 
 def get_customer_orders(customer_name: str) -> str:
-    """Get order history for a specific customer by their name."""
+    """Get order history for a specific customer by their name or phone number."""
     try:
-        response = requests.get(f"{BASE_URL}/orders/customer/{customer_name}")
+        # A phone number is the exact key; names match whole names only.
+        # International numbers ("+33 ...") are phone numbers too: the key is digits only.
+        phone = customer_name.strip().lstrip("+")
+        if validate_phone_number(phone):
+            url = f"{BASE_URL}/orders/phone/{format_phone_number(phone)}"
+        else:
+            url = f"{BASE_URL}/orders/customer/{customer_name}"
+        response = requests.get(url, params={"limit": 20})
         response.raise_for_status()
         return json.dumps(response.json(), indent=2)
     except Exception as e:
@@ -243,7 +263,7 @@ tools = [
     Tool(
         name="get_customer_orders",
         func=get_customer_orders,
-        description="Use this to get past order history for a customer. Input should be the customer's name. Use when customer asks about their previous orders.",
+        description="Use this to get past order history for a customer. Input should be the customer's phone number (preferred) or full name. Use when customer asks about their previous orders.",
         args_schema=CustomerNameInput
     )
 ]
\ No newline at end of file